@@ -0,0 +1,88 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import os
+import platform
+import threading
+
+if platform.system() == "Linux":
+    import resource
+
+    # RUSAGE_THREAD is linux specific, and not exported by python 2
+    RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD', 1)
+
+    def cpu_time():
+        """Returns the cpu time used by the calling thread"""
+        usage = resource.getrusage(RUSAGE_THREAD)
+        return usage.ru_utime + usage.ru_stime
+else:
+    def cpu_time():
+        """Returns the cpu time used by the process"""
+        times = os.times()
+        return times[0] + times[1]
+
+
+_current = threading.local()
+
+
+class Usage:
+    """Resources used by the calling thread while it is being accounted"""
+    def __init__(self):
+        self.subprocesses = 0
+        self.micmgmt_calls = 0
+
+    def __enter__(self):
+        self._outer = getattr(_current, 'usage', None)
+        _current.usage = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.usage = self._outer
+
+        # what a nested accounting used was used by the outer one too
+        if self._outer is not None:
+            self._outer.subprocesses += self.subprocesses
+            self._outer.micmgmt_calls += self.micmgmt_calls
+
+
+def count_subprocess():
+    usage = getattr(_current, 'usage', None)
+
+    if usage is not None:
+        usage.subprocesses += 1
+
+
+def count_micmgmt_call(count=1):
+    usage = getattr(_current, 'usage', None)
+
+    if usage is not None:
+        usage.micmgmt_calls += count
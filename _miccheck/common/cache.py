@@ -0,0 +1,194 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from _miccheck.common import printing as prnt
+
+DEFAULT_PATH = '/var/cache/miccheck/results.json'
+LAST_RUN_PATH = '/var/cache/miccheck/last_run.json'
+# seconds a cached result is reused at most
+DEFAULT_TTL = 24 * 60 * 60
+CACHE_VERSION = 1
+
+
+def result_key(test, device):
+    return '%s/%s' % (test, 'mic%d' % device if device != -1 else 'host')
+
+
+def replace_atomically(path, write):
+    """Has write(file) fill a new file, which then replaces the file at path
+    at once, so concurrent readers never read a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as new_file:
+            write(new_file)
+        os.rename(tmp_path, path)
+    except:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_atomically(path, data, compress=False):
+    """Writes data to path as json, compressed with gzip if compress is set
+    (see replace_atomically())"""
+    def write(json_file):
+        if compress:
+            with gzip.GzipFile(fileobj=json_file, mode='wb') as gzip_file:
+                json.dump(data, gzip_file, separators=(',', ':'))
+        else:
+            json.dump(data, json_file)
+
+    replace_atomically(path, write)
+
+
+def read_json(path):
+    """Returns the data written by write_atomically(), or None when the file
+    is missing, damaged or of another version"""
+    try:
+        with open(path) as json_file:
+            data = json.load(json_file)
+    except (IOError, ValueError):
+        return None
+
+    if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+        return None
+    return data
+
+
+class ResultCache:
+    """Results of tests whose outcome only changes with the state of the host
+    or device they ran on, kept on disk between runs. identity(device) must
+    return a list of strings identifying that state (e.g. boot id, driver
+    version), device being -1 for the host; a result is only reused while
+    the identity is unchanged and it is younger than ttl seconds. Only
+    passed results are kept, so failures are always checked again."""
+    def __init__(self, identity, path=DEFAULT_PATH, ttl=DEFAULT_TTL):
+        self._identity = identity
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._modified = False
+        self._entries = self._load()
+
+    def _load(self):
+        data = read_json(self._path)
+        return data.get('entries', {}) if data else {}
+
+    def lookup(self, test, device):
+        """Returns True if test passed on device, in the current state of
+        the host and device, in the last ttl seconds"""
+        with self._lock:
+            entry = self._entries.get(result_key(test, device))
+
+        if entry is None or time.time() - entry['time'] > self._ttl:
+            return False
+
+        try:
+            return entry['identity'] == self._identity(device)
+        except Exception:
+            # the state cannot be identified, so the test must run
+            return False
+
+    def store(self, test, device):
+        """Records that test passed on device"""
+        try:
+            identity = self._identity(device)
+        except Exception:
+            return
+
+        with self._lock:
+            self._entries[result_key(test, device)] = {'identity': identity,
+                                                      'time': time.time()}
+            self._modified = True
+
+    def save(self):
+        with self._lock:
+            if not self._modified:
+                return
+            data = {'version': CACHE_VERSION, 'entries': self._entries}
+
+        try:
+            write_atomically(self._path, data)
+        except (IOError, OSError), excp:
+            prnt.p_out_debug('Results could not be cached: %s' % excp)
+
+
+class LastRun:
+    """Outcomes of the tests of the last run, kept on disk so that the next
+    run can repeat only what failed. outcomes maps (test, device) to True if
+    the test passed, device being -1 for the host."""
+    def __init__(self, path=LAST_RUN_PATH):
+        self._path = path
+        data = read_json(path)
+        self.found = data is not None
+        self.outcomes = {}
+
+        for record in (data or {}).get('results', []):
+            self.outcomes[(record['test'], record['device'])] = \
+                record['passed']
+
+    def passed(self):
+        return set(key for key, passed in self.outcomes.items() if passed)
+
+    def failed_devices(self, devices):
+        """Returns the devices, among the given ones, which need testing
+        again: those with a test which failed, or which was skipped because
+        a prerequisite did not pass. A failed host test thus only brings
+        back the devices whose tests depend on it."""
+        failed = set(device for (_, device), passed in self.outcomes.items()
+                     if not passed)
+        return [device for device in devices if device in failed]
+
+    def update(self, results):
+        for result in results:
+            self.outcomes[(result.test, result.device)] = result.passed
+
+    def save(self):
+        data = {'version': CACHE_VERSION,
+                'results': [{'test': test, 'device': device, 'passed': passed}
+                            for (test, device), passed in
+                            sorted(self.outcomes.items())]}
+        try:
+            write_atomically(self._path, data)
+        except (IOError, OSError), excp:
+            prnt.p_out_debug('Results of the run could not be saved: %s' %
+                             excp)
@@ -0,0 +1,58 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+# Defaults and limits of the command line options of miccheck, kept apart
+# from the modules they belong to so that parsing the command line does not
+# import those modules (and multiprocessing, mmap or BaseHTTPServer with
+# them) in runs which do not use them. Each module exposes its own under
+# its usual name.
+
+# Unix socket the health daemon listens on
+SOCKET_PATH = '/var/run/miccheckd.sock'
+
+# seconds a call into libmicmgmt, opening the device included, may take
+DEVICE_TIMEOUT = 30
+
+# telemetry samples kept per device, e.g. one hour at one sample per second
+TELEMETRY_SIZE = 3600
+# telemetry samples per second at most
+TELEMETRY_MAX_RATE = 10
+
+METRICS_ADDRESS = '127.0.0.1'
+# seconds between rewrites of the metrics textfile while watching
+METRICS_TEXTFILE_INTERVAL = 10
+
+HISTORY_PATH = '/var/lib/miccheck/history'
+# bytes a history file grows to before it is rotated to <path>.1, which
+# replaces the previous one: about a year of 12 tests run every minute
+HISTORY_MAX_SIZE = 128 * 1024 * 1024
+HISTORY_WINDOW = '7d'
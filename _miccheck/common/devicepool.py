@@ -0,0 +1,107 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import threading
+
+
+class MicDevicePool:
+    """Opens each device at most once, and shares its handle between all the
+    tests of the device. All the handles are closed by close(), which is
+    called when leaving the pool's with block.
+
+    With isolated set, each device is opened in a worker process of its own
+    instead, and every call into libmicmgmt must return within timeout
+    seconds (see devworker.IsolatedMicDevice)."""
+    def __init__(self, isolated=False, timeout=None):
+        self._isolated = isolated
+        self._timeout = timeout
+        self._wrapper = None
+        self._devices = {}
+        self._device_locks = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, dev_num):
+        with self._lock:
+            device_lock = self._device_locks.setdefault(dev_num,
+                                                        threading.Lock())
+
+        # opening a busy device is slow, so only the tests of that device
+        # wait for it
+        with device_lock:
+            if dev_num not in self._devices:
+                if self._wrapper is None:
+                    device = self._open(dev_num)
+                else:
+                    device = self._wrapper(dev_num,
+                                           lambda: self._open(dev_num))
+                self._devices[dev_num] = device
+
+            return self._devices[dev_num]
+
+    def wrap_devices(self, wrapper):
+        """Has devices opened by wrapper(dev_num, open_device) from now on,
+        open_device() opening the device as usual"""
+        self._wrapper = wrapper
+
+    def _open(self, dev_num):
+        # libmicmgmt is only loaded once a test needs a device
+        if self._isolated:
+            from _miccheck.common import devworker
+            if self._timeout is None:
+                return devworker.IsolatedMicDevice(dev_num)
+            return devworker.IsolatedMicDevice(dev_num, self._timeout)
+
+        from _miccheck.common.micdevice import MicDevice
+        return MicDevice(dev_num)
+
+    def discard(self, dev_num):
+        """Closes the handle of a device, so it is opened again when next
+        needed"""
+        with self._lock:
+            device = self._devices.pop(dev_num, None)
+
+        if device is not None:
+            device.close()
+
+    def close(self):
+        with self._lock:
+            devices = self._devices.values()
+            self._devices = {}
+
+        for device in devices:
+            device.close()
@@ -0,0 +1,224 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import multiprocessing
+import os
+import signal
+import threading
+from _miccheck.common import accounting
+from _miccheck.common import defaults
+from _miccheck.common import exceptions as ex
+from _miccheck.common import forking
+
+DEFAULT_TIMEOUT = defaults.DEVICE_TIMEOUT
+
+
+def _serve(conn, parent_conn, dev_num):
+    """Main loop of a worker process: opens the device, then runs the
+    MicDevice methods it is asked for until it is told to stop. Every reply
+    carries the number of libmicmgmt calls made, so the parent can account
+    for them."""
+    parent_conn.close()
+    _close_inherited_fds(conn.fileno())
+    # Ctrl-C reaches the whole process group, miccheck stops the workers
+    # itself; termination must not run the handlers of miccheck either
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    from _miccheck.common.micdevice import MicDevice
+
+    with accounting.Usage() as usage:
+        try:
+            device = MicDevice(dev_num)
+            reply = ('ok', None)
+        except Exception, excp:
+            device = None
+            reply = ('error', excp)
+    _send(conn, reply + (usage.micmgmt_calls,))
+
+    while device is not None:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+
+        if request is None:
+            break
+
+        name, args = request
+        with accounting.Usage() as usage:
+            try:
+                reply = ('ok', getattr(device, name)(*args))
+            except Exception, excp:
+                reply = ('error', excp)
+        _send(conn, reply + (usage.micmgmt_calls,))
+
+    if device is not None:
+        device.close()
+
+
+def _close_inherited_fds(kept):
+    """Closes the files the worker inherited from miccheck, its standard
+    ones and the fd kept aside. Pipes miccheck holds, e.g. those of the
+    programs it runs, then see their end when miccheck closes them, however
+    long the worker lives."""
+    try:
+        max_fd = os.sysconf('SC_OPEN_MAX')
+    except (ValueError, OSError):
+        max_fd = 256
+
+    os.closerange(3, kept)
+    os.closerange(kept + 1, max_fd)
+
+
+def _send(conn, reply):
+    try:
+        conn.send(reply)
+    except Exception:
+        # the exception raised by the device could not be pickled
+        conn.send(('error', RuntimeError(str(reply[1])), reply[2]))
+
+
+def _describe_exit(exitcode):
+    if exitcode is not None and exitcode < 0:
+        for name in dir(signal):
+            if name.startswith('SIG') and not name.startswith('SIG_') and \
+                    getattr(signal, name) == -exitcode:
+                return 'killed by %s' % name
+        return 'killed by signal %d' % -exitcode
+    return 'exit code %s' % exitcode
+
+
+class IsolatedMicDevice:
+    """A MicDevice living in a worker process of its own, so that a call
+    which hangs or crashes in libmicmgmt only fails the tests of its device.
+    The methods of MicDevice are called through the proxy as usual, and
+    each call must return within timeout seconds. A worker which misses
+    the deadline is killed; one which crashed is gone. Either way the call
+    raises FailedTestException, and the next call starts a new worker,
+    which opens the device again."""
+    def __init__(self, dev_num, timeout=DEFAULT_TIMEOUT):
+        self._dev_num = dev_num
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._process = None
+
+        with self._lock:
+            self._start()
+
+    def __del__(self):
+        self.close()
+
+    def __getattr__(self, name):
+        if not name.startswith('mic_'):
+            raise AttributeError(name)
+
+        def call(*args):
+            with self._lock:
+                if self._process is None:
+                    self._start()
+
+                self._conn.send((name, args))
+                return self._receive(name)
+        return call
+
+    def _start(self):
+        # the library is loaded before forking, since a worker forked while
+        # another thread held the lock of the loader would wait for it forever
+        from _miccheck.common import libmicmgmt
+        libmicmgmt.library()
+
+        # the pipes of a worker being started and of programs being run by
+        # other threads must not end up in this worker (see forking.lock)
+        with forking.lock:
+            self._conn, child_conn = multiprocessing.Pipe()
+            self._process = multiprocessing.Process(
+                target=_serve, args=(child_conn, self._conn, self._dev_num))
+            # workers are killed when miccheck exits, even unexpectedly
+            self._process.daemon = True
+            self._process.start()
+            child_conn.close()
+
+        accounting.count_subprocess()
+        self._receive('mic_open_device')
+
+    def _receive(self, name):
+        if not self._conn.poll(self._timeout):
+            self._stop()
+            raise ex.FailedTestException(
+                'device mic%d: %s did not return within %d seconds, its '
+                'worker was killed' % (self._dev_num, name, self._timeout))
+
+        try:
+            status, value, micmgmt_calls = self._conn.recv()
+        except EOFError:
+            exitcode = self._stop()
+            raise ex.FailedTestException(
+                'device mic%d: worker crashed in %s (%s)' %
+                (self._dev_num, name, _describe_exit(exitcode)))
+
+        accounting.count_micmgmt_call(micmgmt_calls)
+
+        if status == 'error':
+            if name == 'mic_open_device':
+                self._stop()
+            raise value
+        return value
+
+    def _stop(self):
+        process = self._process
+        self._process = None
+        self._conn.close()
+
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGKILL)
+        process.join()
+        return process.exitcode
+
+    def close(self):
+        """Closes the device and lets the worker exit"""
+        if getattr(self, '_process', None) is None:
+            return
+
+        process = self._process
+        self._process = None
+
+        try:
+            # the worker closes the device before exiting
+            self._conn.send(None)
+        except (IOError, OSError):
+            pass
+        self._conn.close()
+        process.join(self._timeout)
+
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
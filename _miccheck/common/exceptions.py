@@ -37,3 +37,7 @@ class ExecProgramException(Exception):
 class FailedTestException(Exception):
     pass
 
+
+class MicMgmtLibraryException(Exception):
+    pass
+
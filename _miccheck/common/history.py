@@ -0,0 +1,466 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import array
+import bisect
+import collections
+import errno
+import fcntl
+import mmap
+import os
+import re
+import struct
+import time
+from _miccheck.common import defaults
+
+DEFAULT_PATH = defaults.HISTORY_PATH
+MAX_SIZE = defaults.HISTORY_MAX_SIZE
+DEFAULT_WINDOW = defaults.HISTORY_WINDOW
+
+PASS, FAIL, SKIP = 'P', 'F', 'S'
+
+# The file starts with a header and the table of test names, whose index
+# is the test id, followed by chunks of CHUNK_RECORDS records of one test
+# on one device. A record is a timestamp (double), a duration (float) and
+# a status (char); each is stored in a column of its own within the chunk,
+# so a query reads a column of a chunk as one slice. The header of a chunk
+# keeps the number of its records and the sum of their durations, updated
+# after a record is written, so a record is never read half written.
+MAGIC = 'MICHIST\0'
+VERSION = 1
+HEADER = struct.Struct('<8sIII')  # magic, version, chunks, test names
+NAME_SIZE = 32
+MAX_NAMES = 255
+NAMES_OFFSET = 64
+HEADER_SIZE = NAMES_OFFSET + NAME_SIZE * MAX_NAMES
+# device, test id, records, sum of durations
+CHUNK_HEADER = struct.Struct('<hBxId')
+CHUNK_RECORDS = 4096
+TIMES_OFFSET = CHUNK_HEADER.size
+DURATIONS_OFFSET = TIMES_OFFSET + 8 * CHUNK_RECORDS
+STATUSES_OFFSET = DURATIONS_OFFSET + 4 * CHUNK_RECORDS
+CHUNK_SIZE = STATUSES_OFFSET + CHUNK_RECORDS
+TIME = struct.Struct('<d')
+DURATION = struct.Struct('<f')
+
+WINDOW_RE = re.compile(r'(\d+(?:\.\d+)?)([smhdw]?)$')
+WINDOW_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400,
+                'w': 7 * 86400}
+
+# runs counts the tests which passed or failed, flaps the changes from
+# passing to failing and back, skipped tests aside; mean_duration is in
+# seconds, and trend is how much longer (or shorter, if negative) the tests
+# of the newer half of the window took than those of the older half, as a
+# fraction
+Trend = collections.namedtuple('Trend', (
+    'device', 'test', 'runs', 'failures', 'skipped', 'flaps',
+    'mean_duration', 'trend', 'last_failure'))
+
+
+def parse_window(text):
+    """Returns the seconds of a window like '90', '30m', '24h', '7d' or
+    '52w'"""
+    match = WINDOW_RE.match(text.strip())
+
+    seconds = float(match.group(1)) * WINDOW_UNITS[match.group(2)] \
+        if match else 0
+
+    if not seconds:
+        raise ValueError('invalid window: %s' % text)
+    return seconds
+
+
+class HistoryFile:
+    """A history file, memory-mapped. Appending a record costs the same
+    whatever the size of the file, and processes appending to the same file
+    take turns through a lock on it."""
+    def __init__(self, path, max_size=MAX_SIZE, writable=True):
+        self._path = path
+        self._max_chunks = max(1, (max_size - HEADER_SIZE) // CHUNK_SIZE)
+        self._writable = writable
+        self._open()
+
+    def _open(self):
+        if self._writable:
+            directory = os.path.dirname(os.path.abspath(self._path))
+
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0644)
+        else:
+            self._fd = os.open(self._path, os.O_RDONLY)
+
+        try:
+            self._map = None
+            self._chunks = 0
+            # chunks of each (device, test id) pair, oldest first
+            self._key_chunks = {}
+            self._names = []
+            self._ids = {}
+
+            if os.fstat(self._fd).st_size == 0:
+                if not self._writable:
+                    raise IOError(errno.ENODATA, 'empty history file',
+                                  self._path)
+                with self._locked():
+                    self._initialize()
+            self._refresh()
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _locked(self):
+        return _FileLock(self._fd)
+
+    def _initialize(self):
+        # another process may have initialized it while this one waited
+        if os.fstat(self._fd).st_size == 0:
+            os.ftruncate(self._fd, HEADER_SIZE)
+            os.write(self._fd, HEADER.pack(MAGIC, VERSION, 0, 0))
+
+    def _refresh(self):
+        """Maps the file again if it grew, and reads the chunks and test
+        names other processes added"""
+        size = os.fstat(self._fd).st_size
+
+        if self._map is None or len(self._map) != size:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._fd, size,
+                                  access=mmap.ACCESS_WRITE if self._writable
+                                  else mmap.ACCESS_READ)
+
+        magic, version, chunks, names = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise IOError(errno.EINVAL, 'not a history file of this miccheck '
+                          'version', self._path)
+
+        # a chunk is counted in the header once the file holds it
+        chunks = min(chunks, (size - HEADER_SIZE) // CHUNK_SIZE)
+        for chunk in range(self._chunks, chunks):
+            device, test_id, _, _ = CHUNK_HEADER.unpack_from(
+                self._map, self._chunk_offset(chunk))
+            self._key_chunks.setdefault((device, test_id), []).append(chunk)
+        self._chunks = chunks
+
+        for test_id in range(len(self._names), names):
+            offset = NAMES_OFFSET + test_id * NAME_SIZE
+            name = self._map[offset:offset + NAME_SIZE].rstrip('\0')
+            self._names.append(name)
+            self._ids[name] = test_id
+
+    @staticmethod
+    def _chunk_offset(chunk):
+        return HEADER_SIZE + chunk * CHUNK_SIZE
+
+    def _rotated(self):
+        try:
+            return os.stat(self._path).st_ino != os.fstat(self._fd).st_ino
+        except OSError:
+            return True
+
+    def append(self, records):
+        """Appends records, each a (time, device, test name, status,
+        duration) tuple, device being -1 for the host"""
+        while True:
+            with self._locked():
+                if not self._rotated():
+                    self._refresh()
+                    records = self._append(records)
+
+                    if not records:
+                        return
+                    # the file is full, the rest goes to a new one
+                    os.rename(self._path, self._path + '.1')
+
+            # the file was rotated, by this process or by another one
+            self.close()
+            self._open()
+
+    def _append(self, records):
+        """Appends records until the file is full, and returns those left"""
+        for index, (end, device, test, status, duration) in \
+                enumerate(records):
+            test_id = self._test_id(test)
+
+            if test_id is None:
+                continue
+
+            key = (device, test_id)
+            chunks = self._key_chunks.get(key)
+            if not chunks or self._count(chunks[-1]) == CHUNK_RECORDS:
+                if self._chunks == self._max_chunks:
+                    return records[index:]
+                self._new_chunk(key)
+                chunks = self._key_chunks[key]
+
+            offset = self._chunk_offset(chunks[-1])
+            _, _, count, total = CHUNK_HEADER.unpack_from(self._map, offset)
+            TIME.pack_into(self._map, offset + TIMES_OFFSET + 8 * count, end)
+            DURATION.pack_into(self._map,
+                               offset + DURATIONS_OFFSET + 4 * count,
+                               duration)
+            self._map[offset + STATUSES_OFFSET + count] = status
+            CHUNK_HEADER.pack_into(self._map, offset, device, test_id,
+                                   count + 1, total + duration)
+        return []
+
+    def _count(self, chunk):
+        return CHUNK_HEADER.unpack_from(self._map,
+                                        self._chunk_offset(chunk))[2]
+
+    def time(self, chunk, index):
+        return TIME.unpack_from(self._map, self._chunk_offset(chunk) +
+                                TIMES_OFFSET + 8 * index)[0]
+
+    def _test_id(self, name):
+        test_id = self._ids.get(name)
+
+        if test_id is None and len(self._names) < MAX_NAMES:
+            test_id = len(self._names)
+            offset = NAMES_OFFSET + test_id * NAME_SIZE
+            self._map[offset:offset + NAME_SIZE] = \
+                name[:NAME_SIZE].ljust(NAME_SIZE, '\0')
+            self._names.append(name)
+            self._ids[name] = test_id
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, self._chunks,
+                             len(self._names))
+        return test_id
+
+    def _new_chunk(self, key):
+        chunk = self._chunks
+        self._map.resize(self._chunk_offset(chunk + 1))
+        CHUNK_HEADER.pack_into(self._map, self._chunk_offset(chunk),
+                               key[0], key[1], 0, 0)
+        self._chunks += 1
+        self._key_chunks.setdefault(key, []).append(chunk)
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, self._chunks,
+                         len(self._names))
+        return chunk
+
+    def segments(self, since):
+        """Returns a dict mapping (device, test name) to its records since
+        the given time, as a list of Segment, oldest first"""
+        segments = {}
+
+        for (device, test_id), chunks in self._key_chunks.items():
+            key_segments = []
+
+            # the records of a pair are in time order, so only its latest
+            # chunks are looked at
+            for chunk in reversed(chunks):
+                count = self._count(chunk)
+
+                if not count or self.time(chunk, count - 1) < since:
+                    break
+
+                start = 0
+                if self.time(chunk, 0) < since:
+                    times = array.array('d')
+                    offset = self._chunk_offset(chunk) + TIMES_OFFSET
+                    times.fromstring(self._map[offset:offset + 8 * count])
+                    start = bisect.bisect_left(times, since)
+
+                key_segments.append(Segment(self, chunk, start, count))
+
+                if start:
+                    break
+
+            if key_segments:
+                key_segments.reverse()
+                segments[(device, self._names[test_id])] = key_segments
+
+        return segments
+
+    def statuses(self, chunk, start, end):
+        offset = self._chunk_offset(chunk) + STATUSES_OFFSET
+        return self._map[offset + start:offset + end]
+
+    def duration_sum(self, chunk, start, end):
+        """Returns the sum of the durations of the records from start to
+        end of a chunk"""
+        if start == 0 and end == self._count(chunk):
+            return CHUNK_HEADER.unpack_from(self._map,
+                                            self._chunk_offset(chunk))[3]
+
+        durations = array.array('f')
+        offset = self._chunk_offset(chunk) + DURATIONS_OFFSET
+        durations.fromstring(self._map[offset + 4 * start:offset + 4 * end])
+        return sum(durations)
+
+
+class _FileLock:
+    def __init__(self, fd):
+        self._fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class Segment:
+    """Records start to end of a chunk of a history file"""
+    def __init__(self, history, chunk, start, end):
+        self.history = history
+        self.chunk = chunk
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def statuses(self):
+        return self.history.statuses(self.chunk, self.start, self.end)
+
+    def duration_sum(self, start=0, end=None):
+        """Returns the sum of the durations of the records from start to
+        end of the segment"""
+        if end is None:
+            end = len(self)
+        return self.history.duration_sum(self.chunk, self.start + start,
+                                         self.start + end)
+
+    def time(self, index):
+        return self.history.time(self.chunk, self.start + index)
+
+
+def trend(device, test, segments):
+    """Returns the Trend of the records of a test on a device, given as a
+    list of Segment"""
+    statuses = ''.join(segment.statuses() for segment in segments)
+    half = len(statuses) // 2
+    # the statuses are counted at C speed, and only when there is some to
+    # count, which for most tests means never
+    failed = FAIL in statuses
+    skipped = SKIP in statuses
+    ran = statuses.replace(SKIP, '') if skipped else statuses
+    failure = statuses.rfind(FAIL) if failed else -1
+    last_failure = None
+
+    # skipped tests have no duration, so they add nothing to the sums
+    older = newer = 0.0
+    position = 0
+
+    for segment in segments:
+        split = min(max(half - position, 0), len(segment))
+        if split:
+            older += segment.duration_sum(0, split)
+        if split < len(segment):
+            newer += segment.duration_sum(split)
+
+        if position <= failure < position + len(segment):
+            last_failure = segment.time(failure - position)
+        position += len(segment)
+
+    older_runs = half - (statuses.count(SKIP, 0, half) if skipped else 0)
+    newer_runs = len(ran) - older_runs
+
+    return Trend(device, test, len(ran),
+                 statuses.count(FAIL) if failed else 0,
+                 len(statuses) - len(ran),
+                 ran.count(PASS + FAIL) + ran.count(FAIL + PASS) if failed
+                 else 0,
+                 (older + newer) / len(ran) if ran else None,
+                 (newer / newer_runs) / (older / older_runs) - 1
+                 if older and newer_runs else None,
+                 last_failure)
+
+
+def trends(path, since, devices=None):
+    """Returns the Trend of every test on every device (or on the given
+    ones, -1 being the host) since the given time, from the history file at
+    path and the one it was rotated to before"""
+    histories = []
+    segments = {}
+
+    try:
+        for history_path in (path + '.1', path):
+            try:
+                history = HistoryFile(history_path, writable=False)
+            except (IOError, OSError), excp:
+                if getattr(excp, 'errno', None) in (errno.ENOENT,
+                                                    errno.ENODATA):
+                    continue
+                raise
+
+            histories.append(history)
+            for key, key_segments in history.segments(since).items():
+                segments.setdefault(key, []).extend(key_segments)
+
+        return [trend(device, test, segments[(device, test)])
+                for device, test in sorted(segments)
+                if devices is None or device in devices]
+    finally:
+        for history in histories:
+            history.close()
+
+
+def describe(trend):
+    """Returns a line like 'mic0 StateTest runs=1440 failed=2.1% flaps=6
+    duration=0.012s trend=+3.0% last_failure=...', 'host' standing for
+    device -1"""
+    fields = ['mic%d' % trend.device if trend.device != -1 else 'host',
+              trend.test, 'runs=%d' % trend.runs]
+
+    if trend.runs:
+        fields.append('failed=%.1f%%' % (100.0 * trend.failures /
+                                         trend.runs))
+    fields.append('flaps=%d' % trend.flaps)
+
+    if trend.skipped:
+        fields.append('skipped=%d' % trend.skipped)
+    if trend.mean_duration is not None:
+        fields.append('duration=%.3fs' % trend.mean_duration)
+    if trend.trend is not None:
+        fields.append('trend=%+.1f%%' % (100 * trend.trend))
+    if trend.last_failure is not None:
+        fields.append('last_failure=%s' %
+                      time.strftime('%Y-%m-%dT%H:%M:%S',
+                                    time.localtime(trend.last_failure)))
+    return ' '.join(fields)
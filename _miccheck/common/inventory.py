@@ -0,0 +1,110 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import threading
+
+
+class HostInventory:
+    """State of the host, probed at most once per run and shared by every
+    test. probes maps the name of each piece of state to the function
+    probing it. persistent names the values which hold resources used to
+    probe (e.g. open files) rather than state, they are kept when the state
+    is invalidated. Values having a close() method are closed when they are
+    dropped, and all of them are dropped by close(), which is called when
+    leaving the inventory's with block."""
+    def __init__(self, probes, persistent=()):
+        self._probes = probes
+        self._persistent = persistent
+        self._values = {}
+        self._probe_locks = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, name):
+        with self._lock:
+            probe_lock = self._probe_locks.setdefault(name, threading.RLock())
+
+        # each value is probed under its own lock, so a slow probe only holds
+        # up the tests which need that value. probes get the values they
+        # depend on, which never depend back on them, so locks are always
+        # taken in the same order
+        with probe_lock:
+            with self._lock:
+                if name in self._values:
+                    return self._values[name]
+
+            value = self._probes[name]()
+
+            with self._lock:
+                self._values[name] = value
+            return value
+
+    def set(self, name, value):
+        """Sets a value instead of probing it, e.g. one chosen by the run
+        rather than found on the host. It is kept when the state is
+        invalidated."""
+        with self._lock:
+            self._values[name] = value
+            self._persistent = tuple(self._persistent) + (name,)
+
+    def wrap_probes(self, wrapper):
+        """Replaces each probe by wrapper(name, probe), e.g. to record what
+        it returns. Must be called before anything is probed."""
+        self._probes = dict((name, wrapper(name, probe))
+                            for name, probe in self._probes.items())
+
+    def invalidate(self, name=None):
+        """Drops the probed state, so it is probed again when next needed.
+        If name is None, all state is dropped."""
+        if name is None:
+            names = [n for n in self._probes if n not in self._persistent]
+        else:
+            names = [name]
+
+        self._drop(names)
+
+    def close(self):
+        self._drop(self._probes.keys())
+
+    def _drop(self, names):
+        with self._lock:
+            dropped = [self._values.pop(name) for name in names
+                       if name in self._values]
+
+        for value in dropped:
+            if hasattr(value, 'close'):
+                value.close()
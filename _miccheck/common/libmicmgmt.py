@@ -0,0 +1,127 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import ctypes
+import platform
+import threading
+from _miccheck.common import accounting
+from _miccheck.common import exceptions as ex
+
+if platform.system() == "Linux":
+    MICMGMT_LIBRARY = "libmicmgmt.so.0"
+else:
+    MICMGMT_LIBRARY = "micmgmt.dll"
+
+E_MIC_SUCCESS = 0
+
+# every handle of the library (devices list, device, thermal, power and
+# throttle state info) is an opaque pointer
+HANDLE = ctypes.c_void_p
+P_HANDLE = ctypes.POINTER(ctypes.c_void_p)
+P_INT = ctypes.POINTER(ctypes.c_int)
+P_UINT32 = ctypes.POINTER(ctypes.c_uint32)
+
+# argument types of the functions used by miccheck, all of them return an
+# error code which is E_MIC_SUCCESS on success
+PROTOTYPES = {
+    'mic_get_devices': [P_HANDLE],
+    'mic_get_ndevices': [HANDLE, P_INT],
+    'mic_free_devices': [HANDLE],
+    'mic_open_device': [P_HANDLE, ctypes.c_uint32],
+    'mic_close_device': [HANDLE],
+    'mic_is_ras_avail': [HANDLE, P_INT],
+    'mic_get_thermal_info': [HANDLE, P_HANDLE],
+    'mic_get_smc_fwversion': [HANDLE, ctypes.c_char_p,
+                              ctypes.POINTER(ctypes.c_size_t)],
+    'mic_free_thermal_info': [HANDLE],
+    'mic_get_die_temp': [HANDLE, P_UINT32],
+    'mic_get_fan_rpm': [HANDLE, P_UINT32],
+    'mic_get_fan_pwm': [HANDLE, P_UINT32],
+    'mic_get_power_utilization_info': [HANDLE, P_HANDLE],
+    'mic_get_total_power_readings_w0': [HANDLE, P_UINT32],
+    'mic_free_power_utilization_info': [HANDLE],
+    'mic_get_throttle_state_info': [HANDLE, P_HANDLE],
+    'mic_get_thermal_ttl_active': [HANDLE, P_INT],
+    'mic_get_power_ttl_active': [HANDLE, P_INT],
+    'mic_free_throttle_state_info': [HANDLE],
+}
+
+_library = None
+_lock = threading.Lock()
+
+
+class Library:
+    """The functions of the library listed in PROTOTYPES, counting their
+    calls for accounting"""
+    def __init__(self, mic):
+        for func_name in PROTOTYPES:
+            setattr(self, func_name, _counted(getattr(mic, func_name)))
+
+
+def _counted(func):
+    def call(*args):
+        accounting.count_micmgmt_call()
+        return func(*args)
+    return call
+
+
+def library():
+    """Returns the library, loading it and declaring its prototypes the first
+    time it is needed by the process"""
+    global _library
+
+    if _library is None:
+        with _lock:
+            if _library is None:
+                _library = Library(load(MICMGMT_LIBRARY))
+
+    return _library
+
+
+def load(name):
+    try:
+        mic = ctypes.CDLL(name)
+    except OSError, excp:
+        raise ex.MicMgmtLibraryException('%s could not be loaded, make sure '
+                                         'MPSS is installed: %s' %
+                                         (name, excp))
+
+    for func_name, argtypes in PROTOTYPES.items():
+        try:
+            func = getattr(mic, func_name)
+        except AttributeError:
+            raise ex.MicMgmtLibraryException('%s does not provide %s' %
+                                             (name, func_name))
+        func.argtypes = argtypes
+        func.restype = ctypes.c_int
+
+    return mic
@@ -31,20 +31,30 @@
 # no license, express or implied, by estoppel or otherwise, to any
 # intellectual property rights is granted herein.
 import sys
+import json
 import optparse as op
 import platform
 import textwrap
+import time
+from _miccheck.common import cache
+from _miccheck.common import defaults
+from _miccheck.common import registry
+from _miccheck.common import reporters
 from _miccheck.common import testrunner
-if platform.system() == "Linux":
-    from _miccheck.linux import tests as pltfm
-elif platform.system() == "Windows":
-    from _miccheck.windows import tests as pltfm
+from _miccheck.common.devicepool import MicDevicePool
 from _miccheck.common import printing as prnt
 from _miccheck.common import exceptions as ex
 import _miccheck
 
 
+BANNER = 'MicCheck {0}\nCopyright (c) 2015, Intel Corporation.\n'
+
+
 class MiccheckOptionParser(op.OptionParser):
+    def print_help(self, file=None):
+        (file or sys.stdout).write(BANNER.format(_miccheck.__version__) + '\n')
+        op.OptionParser.print_help(self, file)
+
     def error(self, msg):
         self.print_help(sys.stdout)
         self.exit(2, "\n%s: error: %s\n" % (self.get_prog_name(), msg))
@@ -55,12 +65,17 @@ def parse_command_line(argv):
         Utility which performs software sanity checks on a host machine with
         Intel(R) Xeon Phi(TM) coprocessors installed, by running a suite of
         diagnostic tests. By default, a subset of all available tests are run;
-        additional tests can be enabled individually. The default behavior is
-        to run all enabled tests applicable to the host system first, and then
-        those applicable to the Intel(R) Xeon Phi(TM) coprocessors in turn.""")
+        additional tests can be enabled individually or by tag. The default
+        behavior is to run all enabled tests applicable to the host system
+        first, and then those applicable to the Intel(R) Xeon Phi(TM)
+        coprocessors in turn.""")
+    usage = '%prog [options]'
+    if platform.system() == "Linux":
+        usage += '\n       %prog history [--window=WINDOW] [options]'
 
     parser = MiccheckOptionParser(formatter=op.TitledHelpFormatter(width=79),
-                                  add_help_option=None, description=desc)
+                                  add_help_option=None, description=desc,
+                                  usage=usage)
     # options
     options_group = op.OptionGroup(parser, 'General')
     options_group.add_option('-h', '--help', action='help',
@@ -75,60 +90,145 @@ def parse_command_line(argv):
                              dest='device', default='all',
                              help='Select device on which to run. Example: '
                                   '--device=0. Only one device can be selected.')
-    # tests
-    tests_group = op.OptionGroup(parser, 'Tests available')
-    tests_group.add_option('', '--pci_numdev', dest='pci_devices',
-                           action='store_true', default=True,
-                           help='Check whether Intel(R) Xeon Phi(TM) coprocessors are'
-                                ' detected over PCI [enabled=%default].')
-    tests_group.add_option('', '--driver_loaded', dest='driver_loaded',
-                           action='store_true', default=True,
-                           help='Check whether Intel(R) Xeon Phi(TM) driver is loaded '
-                                ' in the host [enabled=%default].')
-    tests_group.add_option('', '--driver_numdev', dest='driver_devices',
-                           action='store_true', default=True,
-                           help='Check whether driver detected the same '
-                                'number of devices as PCI enumeration did '
-                                '[enabled=%default].')
-
-    if platform.system() == "Linux":
-        tests_group.add_option('', '--mpssd_loaded', dest='mpssd_loaded',
-                               action='store_true', default=True,
-                               help='Check whether MPSS daemon is running '
-                                    '[enabled=%default].')
-
-    tests_group.add_option('', '--driver_ver', dest='driver_ver',
-                           action='store_true', default=False,
-                           help='Check whether loaded driver version is correct '
-                                '[enabled=%default].')
-    tests_group.add_option('', '--dev_state', dest='dev_state',
-                           action='store_true', default=True,
-                           help='Check whether device state is online and '
-                                'its postcode is FF [enabled=%default].')
-    tests_group.add_option('', '--dev_rasdaemon', dest='dev_rasdaemon',
-                           action='store_true', default=True,
-                           help='Check whether RAS daemon is available in device '
-                                '[enabled=%default].')
     if platform.system() == "Linux":
-        tests_group.add_option('', '--flash_ver', dest='flash_ver',
-                               action='store_true', default=True,
-                               help='Check whether running flash version of device is correct '
-                                    '[enabled=%default].')
-
-    tests_group.add_option('', '--smc_ver', dest='smc_ver',
-			   action='store_true', default=True,
-			   help='Check whether running SMC firmware version of device is correct '
-				'[enabled=%default].')
-
+        options_group.add_option('-j', '--jobs', dest='jobs', type='int',
+                                 default=1,
+                                 help='Number of tests to run in parallel, '
+                                      'one at a time per device '
+                                      '[default=%default].')
+    options_group.add_option('-f', '--format', dest='format',
+                             type='choice', choices=reporters.FORMATS,
+                             default='text',
+                             help='Format of the test results: %s. Other '
+                                  'output goes to stderr when it is not '
+                                  'text. Watch and daemon only report as '
+                                  'text [default=%%default].' %
+                                  ', '.join(reporters.FORMATS))
+    options_group.add_option('-t', '--timings', dest='timings',
+                             action='store_true', default=False,
+                             help='Show how long each test took and what it '
+                                  'used, slowest first.')
+    options_group.add_option('-w', '--watch', dest='watch',
+                             action='store_true', default=False,
+                             help='Keep running, repeating each test at its '
+                                  'own interval, and only report results '
+                                  'which changed.')
     if platform.system() == "Linux":
-        tests_group.add_option('', '--ping', dest='ping',
-                               action='store_true', default=False,
-                               help='Check whether network interface of device can '
-                                    'be pinged [enabled=%default].')
-        tests_group.add_option('', '--ssh', dest='ssh',
-                               action='store_true', default=False,
-                               help='Check whether network interface of device can '
-                                    'be accessed through ssh [enabled=%default].')
+        options_group.add_option('', '--daemon', dest='daemon',
+                                 action='store_true', default=False,
+                                 help='Keep running like --watch and answer '
+                                      'health queries of miccheck_status.py '
+                                      'over a Unix socket.')
+        options_group.add_option('', '--socket', dest='socket',
+                                 default=defaults.SOCKET_PATH,
+                                 help='Unix socket the daemon listens on '
+                                      '[default=%default].')
+        options_group.add_option('', '--no-cache', dest='cache',
+                                 action='store_false', default=True,
+                                 help='Run every test, even those which '
+                                      'passed recently with the host and '
+                                      'devices in the same state.')
+        options_group.add_option('', '--cache-file', dest='cache_file',
+                                 default=cache.DEFAULT_PATH,
+                                 help='File keeping the results of previous '
+                                      'runs [default=%default].')
+        options_group.add_option('', '--cache-ttl', dest='cache_ttl',
+                                 type='int', default=cache.DEFAULT_TTL,
+                                 help='Seconds a cached result is reused at '
+                                      'most [default=%default].')
+        options_group.add_option('', '--rerun-failed', dest='rerun_failed',
+                                 action='store_true', default=False,
+                                 help='Run again only the tests which failed '
+                                      'in the last run and their '
+                                      'prerequisites, on the devices where '
+                                      'they failed.')
+        options_group.add_option('', '--last-run-file', dest='last_run_file',
+                                 default=cache.LAST_RUN_PATH,
+                                 help='File keeping the outcome of every test '
+                                      'of the last run [default=%default].')
+        options_group.add_option('', '--no-isolation', dest='isolate',
+                                 action='store_false', default=True,
+                                 help='Call libmicmgmt from miccheck itself '
+                                      'instead of from a worker process per '
+                                      'device. Without workers, a hang or '
+                                      'crash in the library stops the whole '
+                                      'run.')
+        options_group.add_option('', '--device-timeout', dest='device_timeout',
+                                 type='int', default=defaults.DEVICE_TIMEOUT,
+                                 help='Seconds a call into libmicmgmt may '
+                                      'take before the worker of its device '
+                                      'is killed [default=%default].')
+        options_group.add_option('', '--telemetry', dest='telemetry',
+                                 type='float', metavar='HZ',
+                                 help='While watching or serving, sample the '
+                                      'temperature, fan, power and throttle '
+                                      'state of the devices this many times '
+                                      'per second (at most %d).' %
+                                      defaults.TELEMETRY_MAX_RATE)
+        options_group.add_option('', '--telemetry-samples',
+                                 dest='telemetry_samples', type='int',
+                                 default=defaults.TELEMETRY_SIZE,
+                                 help='Telemetry samples kept per device '
+                                      '[default=%default].')
+        options_group.add_option('', '--metrics-file', dest='metrics_file',
+                                 metavar='FILE',
+                                 help='Write the results of the tests and '
+                                      'the telemetry of the devices in the '
+                                      'OpenMetrics format, e.g. for the '
+                                      'textfile collector of node_exporter. '
+                                      'While watching or serving, the file '
+                                      'is rewritten every %d seconds.' %
+                                      defaults.METRICS_TEXTFILE_INTERVAL)
+        options_group.add_option('', '--metrics-port', dest='metrics_port',
+                                 type='int', metavar='PORT',
+                                 help='While watching or serving, serve the '
+                                      'same metrics over HTTP at /metrics.')
+        options_group.add_option('', '--metrics-address',
+                                 dest='metrics_address',
+                                 default=defaults.METRICS_ADDRESS,
+                                 help='Address the metrics are served on '
+                                      '[default=%default].')
+        options_group.add_option('', '--capture', dest='capture',
+                                 metavar='FILE',
+                                 help='Record the state probed by the tests '
+                                      'in a snapshot file, to evaluate them '
+                                      'again elsewhere with --replay.')
+        options_group.add_option('', '--replay', dest='replay',
+                                 metavar='FILE',
+                                 help='Run the tests against the state '
+                                      'recorded in a snapshot file by '
+                                      '--capture, without accessing the '
+                                      'host or devices.')
+        options_group.add_option('', '--history-file', dest='history_file',
+                                 default=defaults.HISTORY_PATH,
+                                 help='File the outcome of every test run is '
+                                      'appended to, and which "miccheck '
+                                      'history" reports on. It is rotated '
+                                      'to FILE.1 once it reaches %d MiB '
+                                      '[default=%%default].' %
+                                      (defaults.HISTORY_MAX_SIZE //
+                                       (1024 * 1024)))
+        options_group.add_option('', '--no-history', dest='record_history',
+                                 action='store_false', default=True,
+                                 help='Do not append the outcomes of this '
+                                      'run to the history file.')
+        options_group.add_option('', '--window', dest='window',
+                                 default=defaults.HISTORY_WINDOW,
+                                 help='Period "miccheck history" reports '
+                                      'on, in seconds or with a unit of s, '
+                                      'm, h, d or w, e.g. 24h '
+                                      '[default=%default].')
+    # tests, generated from the registry
+    tests_group = op.OptionGroup(parser, 'Tests available',
+                                 'Each test can also be disabled with '
+                                 '--no-<test>, e.g. --no-smc_ver.')
+    tests_group.add_option('', '--tags', dest='tags',
+                           help='Run the tests having any of these comma '
+                                'separated tags instead of the default ones: '
+                                '%s. Tests enabled or disabled one by one '
+                                'are run or not regardless.' %
+                                ', '.join(registry.TAGS))
+    registry.add_options(tests_group)
 
     parser.add_option_group(options_group)
     parser.add_option_group(tests_group)
@@ -136,20 +236,107 @@ def parse_command_line(argv):
     settings, args = parser.parse_args(argv)
 
     # validate parsed args
-    if args:
+    settings.query_history = args == ['history'] and \
+        hasattr(settings, 'history_file')
+    if args and not settings.query_history:
         parser.error('options not supported: "%s"' % (args,))
 
     if settings.verbose:
         prnt.set_debug()
 
-    settings.device = select_devices(settings.device)
+    if settings.tags is not None:
+        try:
+            settings.tags = registry.parse_tags(settings.tags)
+        except ValueError, excp:
+            parser.error(str(excp))
+
+    if getattr(settings, 'jobs', 1) < 1:
+        parser.error('jobs must be greater than 0')
+
+    if getattr(settings, 'cache_ttl', 0) < 0:
+        parser.error('cache-ttl cannot be negative')
+
+    if getattr(settings, 'device_timeout', 1) < 1:
+        parser.error('device-timeout must be greater than 0')
+
+    if settings.format != 'text' and (settings.watch or
+                                      getattr(settings, 'daemon', False)):
+        # changes are reported as they happen, as text only
+        parser.error('format %s cannot be used with watch or daemon' %
+                     settings.format)
+
+    if getattr(settings, 'rerun_failed', False) and \
+            (settings.watch or settings.daemon):
+        parser.error('rerun-failed cannot be used with watch or daemon')
+
+    if getattr(settings, 'capture', None) or getattr(settings, 'replay', None):
+        if settings.capture and settings.replay:
+            parser.error('capture and replay cannot be used together')
+
+        if settings.watch or settings.daemon:
+            parser.error('capture and replay cannot be used with watch or '
+                         'daemon')
+
+    if getattr(settings, 'telemetry', None) is not None:
+        if not 0 < settings.telemetry <= defaults.TELEMETRY_MAX_RATE:
+            parser.error('telemetry must be greater than 0 and at most %d' %
+                         defaults.TELEMETRY_MAX_RATE)
+
+        if not (settings.watch or settings.daemon):
+            parser.error('telemetry is only sampled with watch or daemon')
+
+    if getattr(settings, 'metrics_port', None) is not None:
+        if not 0 < settings.metrics_port < 65536:
+            parser.error('metrics-port must be between 1 and 65535')
+
+        if not (settings.watch or settings.daemon):
+            parser.error('metrics are only served with watch or daemon')
+
+    if getattr(settings, 'telemetry_samples', 1) < 1:
+        parser.error('telemetry-samples must be greater than 0')
+
+    if getattr(settings, 'capture', None):
+        if settings.rerun_failed:
+            parser.error('rerun-failed cannot be used with capture')
+
+        # cached passes are never probed, so they would not be captured
+        settings.cache = False
+
+    if getattr(settings, 'replay', None):
+        if settings.rerun_failed:
+            parser.error('rerun-failed cannot be used with replay')
+
+        # the results of a replay are not those of this host
+        settings.cache = False
+        settings.last_run_file = None
+        settings.record_history = False
+
+    if settings.query_history:
+        if settings.watch or settings.daemon or settings.capture or \
+                settings.replay:
+            parser.error('history cannot be used with watch, daemon, '
+                         'capture or replay')
+
+        if settings.format == 'junit':
+            parser.error('history is reported as text or jsonl')
+
+        from _miccheck.common import history
+        try:
+            settings.window = history.parse_window(settings.window)
+        except ValueError, excp:
+            parser.error(str(excp))
+
+    if getattr(settings, 'daemon', False):
+        # the daemon keeps testing and reports changes like watch mode does
+        settings.watch = True
+
     return settings, parser
 
 
-def select_devices(devices):
+def select_devices(devices, inventory):
     device_list = []
     # depending on platform, get the number of devices detected over pci
-    num_devices = pltfm.num_mics_pci()
+    num_devices = inventory.get('num_mics_pci')
 
     if devices == 'all':
         device_list = [i for i in range(num_devices)]
@@ -170,21 +357,337 @@ def select_devices(devices):
     return device_list
 
 
+def test_plan(settings):
+    """Returns the selected tests as (title, device, tests) groups, in the
+    order their output is printed"""
+    plan = [('Executing default tests for host', -1,
+             registry.tests(settings, registry.HOST, True)),
+            ('Executing optional tests for host', -1,
+             registry.tests(settings, registry.HOST, False))]
+
+    for device in settings.device:
+        plan.append(('Executing default tests for device: %d' % device,
+                     device, registry.tests(settings, registry.DEVICE, True,
+                                            device)))
+
+    for device in settings.device:
+        plan.append(('Executing optional tests for device: %d' % device,
+                     device, registry.tests(settings, registry.DEVICE, False,
+                                            device)))
+
+    return plan
+
+
+def add_tests(watcher, settings):
+    for _, device, tests in test_plan(settings):
+        for test in tests:
+            watcher.add(test, device)
+
+
+def telemetry_sampler(settings):
+    """Returns the telemetry Sampler of the selected devices, or None if
+    telemetry is not sampled"""
+    if not getattr(settings, 'telemetry', None):
+        return None
+
+    from _miccheck.common import telemetry
+    return telemetry.Sampler(
+        settings.device_pool, settings.device, settings.telemetry,
+        settings.telemetry_samples,
+        settings.exporter.update_telemetry if settings.exporter else None)
+
+
+def append_history(settings, records):
+    """Appends (time, device, test, status, duration) records to the history
+    file; a history which cannot be written does not fail the run"""
+    from _miccheck.common import history
+    try:
+        if settings.history_log is None:
+            settings.history_log = history.HistoryFile(settings.history_file)
+        settings.history_log.append(records)
+    except (IOError, OSError), excp:
+        prnt.p_out_debug('Outcomes could not be added to the history: %s' %
+                         excp)
+
+
+def record_results(settings, results):
+    """Appends the outcomes of the tests of a run to the history file"""
+    from _miccheck.common import history
+    # cached results were not checked again in this run
+    append_history(settings, [
+        (result.start + result.wall_time, result.device, result.test,
+         history.PASS if result.passed else history.SKIP
+         if result.skipped else history.FAIL,
+         0.0 if result.skipped else result.wall_time)
+        for result in results if not result.cached])
+
+
+def watcher(settings):
+    from _miccheck.common import watch
+
+    def on_outcome(test, device, passed, duration, end, skipped):
+        if settings.exporter:
+            settings.exporter.update_result(test, device, passed, duration,
+                                            end)
+        if getattr(settings, 'record_history', False):
+            # history is only kept on linux
+            from _miccheck.common import history
+            append_history(settings, [(end, device, test,
+                                       history.PASS if passed
+                                       else history.SKIP if skipped
+                                       else history.FAIL,
+                                       0.0 if skipped else duration)])
+
+    return watch.Watcher(settings.inventory, settings.device_pool,
+                         on_outcome=on_outcome)
+
+
+def start_exporting(settings):
+    """Starts writing and serving the metrics as the options ask, and
+    returns what was started, to be stopped at the end"""
+    from _miccheck.common import metrics
+    exporters = []
+
+    if getattr(settings, 'metrics_file', None):
+        exporters.append(metrics.TextfileWriter(settings.exporter,
+                                                settings.metrics_file))
+
+    if getattr(settings, 'metrics_port', None):
+        exporters.append(metrics.MetricsServer(settings.exporter,
+                                               settings.metrics_port,
+                                               settings.metrics_address))
+
+    for exporter in exporters:
+        exporter.start()
+    return exporters
+
+
+def watch_tests(settings):
+    test_watcher = watcher(settings)
+    add_tests(test_watcher, settings)
+    sampler = telemetry_sampler(settings)
+    start = time.time()
+    exporters = start_exporting(settings)
+
+    prnt.p_out('Watching tests, press Ctrl-C to stop')
+    if sampler:
+        sampler.start()
+
+    try:
+        test_watcher.run()
+    finally:
+        if sampler:
+            sampler.stop()
+            prnt.p_out('\nTelemetry while watching, min/mean/p95/max:')
+
+            for line in sampler.report(time.time() - start):
+                prnt.p_out('  ' + line)
+
+        for exporter in exporters:
+            exporter.stop()
+    return 0
+
+
+def serve_health(settings):
+    from _miccheck.linux import daemon
+    health_daemon = daemon.HealthDaemon(watcher(settings), settings.device,
+                                        settings.socket,
+                                        telemetry_sampler(settings))
+    add_tests(health_daemon, settings)
+    exporters = start_exporting(settings)
+
+    try:
+        health_daemon.serve()
+    finally:
+        for exporter in exporters:
+            exporter.stop()
+    return 0
+
+
+def show_history(settings):
+    """Reports how each test fared over the window, from the history file
+    alone"""
+    from _miccheck.common import history
+    since = time.time() - settings.window
+    devices = None
+
+    if settings.device != 'all':
+        try:
+            devices = (-1, int(settings.device))
+        except ValueError, excp:
+            raise Exception('invalid device argument: %s' % excp)
+
+    trends = history.trends(settings.history_file, since, devices)
+
+    if settings.format == 'jsonl':
+        for trend in trends:
+            record = dict(trend._asdict(), type='history',
+                          device=reporters.device_name(trend.device),
+                          since=reporters.timestamp(since))
+            if trend.last_failure is not None:
+                record['last_failure'] = reporters.timestamp(
+                    trend.last_failure)
+            sys.stdout.write(json.dumps(record, sort_keys=True) + '\n')
+        return 0
+
+    if not trends:
+        prnt.p_out('No outcomes since %s in %s' % (time.ctime(since),
+                                                   settings.history_file))
+        return 0
+
+    prnt.p_out('Outcomes since %s:' % time.ctime(since))
+    for trend in trends:
+        prnt.p_out('  ' + history.describe(trend))
+    return 0
+
+
 def main():
+    settings = None
+    test_runner = None
+    result_cache = None
+    last_run = None
+    recording = None
+    status = 1
+
     try:
-        banner = 'MicCheck {0}\nCopyright (c) 2015, Intel Corporation.\n'
-        prnt.p_out(banner.format(_miccheck.__version__))
         settings, args = parse_command_line(sys.argv[1:])  # parse command line
 
-        test_runner = testrunner.TestRunner()
-        pltfm.default_host_tests(test_runner, settings)
-        pltfm.optional_host_tests(test_runner, settings)
-        pltfm.default_device_tests(test_runner, settings.device, settings)
-        pltfm.optional_device_tests(test_runner, settings.device, settings)
+        if settings.format != 'text':
+            # stdout is left to the test results
+            prnt.set_out_stream(sys.stderr)
+
+        prnt.p_out(BANNER.format(_miccheck.__version__))
+
+        if settings.query_history:
+            status = show_history(settings)
+            return status
+
+        # host state is probed once and shared by all the tests of this run,
+        # device handles are opened once and closed when the run ends
+        pltfm = registry.platform_module()
+        settings.inventory = pltfm.host_inventory()
+        settings.device_pool = MicDevicePool(
+            getattr(settings, 'isolate', False),
+            getattr(settings, 'device_timeout', None))
+
+        if getattr(settings, 'replay', None):
+            from _miccheck.common import snapshot
+            recording = snapshot.Replay(settings.replay)
+            prnt.p_out('Replaying the state of %s captured on %s by miccheck '
+                       '%s\n' % (recording.host, time.ctime(recording.time),
+                                 recording.version))
+        elif getattr(settings, 'capture', None):
+            from _miccheck.common import snapshot
+            recording = snapshot.Capture()
+
+        if recording:
+            settings.inventory.wrap_probes(recording.probe)
+            settings.device_pool.wrap_devices(recording.device)
+
+        settings.exporter = None
+        settings.history_log = None
+        if getattr(settings, 'metrics_file', None) or \
+                getattr(settings, 'metrics_port', None):
+            from _miccheck.common import metrics
+            settings.exporter = metrics.Exporter()
+
+            if settings.metrics_file:
+                settings.exporter.load_last_successes(settings.metrics_file)
+
+        if getattr(settings, 'cache', False) and not settings.watch:
+            result_cache = cache.ResultCache(
+                lambda device: pltfm.cache_identity(settings.inventory,
+                                                    device),
+                settings.cache_file, settings.cache_ttl)
+
+        skip = ()
+        if getattr(settings, 'last_run_file', None) and not settings.watch:
+            last_run = cache.LastRun(settings.last_run_file)
+
+            if not settings.rerun_failed:
+                last_run.outcomes.clear()
+            elif last_run.found:
+                # the prerequisites of the failed tests run again anyway
+                skip = last_run.passed()
+
+                if all(last_run.outcomes.values()):
+                    prnt.p_out('Nothing failed in the last run')
+            else:
+                prnt.p_out('No outcomes of a previous run, running all tests')
+
+        test_runner = testrunner.TestRunner(reporters.create(settings.format),
+                                            result_cache, skip)
+        with settings.inventory, settings.device_pool:
+            settings.device = select_devices(settings.device,
+                                             settings.inventory)
+
+            if skip:
+                settings.device = last_run.failed_devices(settings.device)
+                prnt.p_out_debug('Device(s) to test again = %s' %
+                                 settings.device)
+            # host probes of the devices, e.g. ping, only reach these
+            settings.inventory.set('devices', settings.device)
+
+            if getattr(settings, 'daemon', False):
+                status = serve_health(settings)
+                return status
+            elif settings.watch:
+                status = watch_tests(settings)
+                return status
+
+            failed, skipped = test_runner.run_plan(
+                test_plan(settings), getattr(settings, 'jobs', 1))
+
+            if failed or skipped:
+                raise ex.FailedTestException('%d test(s) failed, %d skipped' %
+                                             (failed, skipped))
 
         prnt.p_out('\nStatus: OK')
-        return 0
+        status = 0
     except Exception, excp:
         prnt.p_out('\nStatus: FAIL')
         prnt.p_err('Failure: ' + str(excp))
-        return 1
+    finally:
+        if recording and settings.capture:
+            # the state of a failed run is the most useful to look at
+            try:
+                recording.save(settings.capture)
+            except (IOError, OSError), excp:
+                prnt.p_err('Snapshot could not be saved: %s' % excp)
+
+        if result_cache:
+            # results which passed before a failure are still worth keeping
+            result_cache.save()
+
+        if last_run and test_runner:
+            # after a rerun, the outcomes of the tests not run again are
+            # kept, so the saved outcomes combine both runs
+            last_run.update(test_runner.results)
+            last_run.save()
+
+        if test_runner and getattr(settings, 'record_history', False) and \
+                not settings.watch:
+            record_results(settings, test_runner.results)
+
+        if getattr(settings, 'history_log', None):
+            settings.history_log.close()
+
+        if test_runner and getattr(settings, 'exporter', None) and \
+                not settings.watch:
+            for result in test_runner.results:
+                settings.exporter.update_result(
+                    result.test, result.device, result.passed,
+                    result.wall_time, result.start + result.wall_time)
+
+            try:
+                settings.exporter.write_textfile(settings.metrics_file)
+            except (IOError, OSError), excp:
+                prnt.p_err('Metrics could not be written: %s' % excp)
+
+        if test_runner and not settings.watch:
+            test_runner.finish(status == 0)
+
+            if settings.timings:
+                test_runner.print_timings()
+
+    return status
@@ -0,0 +1,279 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import BaseHTTPServer
+import collections
+import os
+import SocketServer
+import threading
+from _miccheck.common import cache
+from _miccheck.common import defaults
+from _miccheck.common import printing as prnt
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+DEFAULT_ADDRESS = defaults.METRICS_ADDRESS
+TEXTFILE_INTERVAL = defaults.METRICS_TEXTFILE_INTERVAL
+
+# name, type and help of each metric family, in the order they are exposed
+FAMILIES = (
+    ('miccheck_test_passed', 'gauge',
+     'Whether the latest run of the test passed.'),
+    ('miccheck_test_duration_seconds', 'gauge',
+     'Seconds the latest run of the test took.'),
+    ('miccheck_test_last_success_timestamp_seconds', 'gauge',
+     'Time the test last passed, in seconds since the epoch.'),
+    ('miccheck_device_die_temperature_celsius', 'gauge',
+     'Die temperature of the device.'),
+    ('miccheck_device_fan_rpm', 'gauge',
+     'Speed of the fan of the device.'),
+    ('miccheck_device_fan_pwm_percent', 'gauge',
+     'Duty cycle of the fan of the device.'),
+    ('miccheck_device_power_watts', 'gauge',
+     'Total power drawn by the device.'),
+    ('miccheck_device_thermal_throttled', 'gauge',
+     'Whether the device is throttled to stay within its thermal limits.'),
+    ('miccheck_device_power_throttled', 'gauge',
+     'Whether the device is throttled to stay within its power limits.'),
+    ('miccheck_device_telemetry_timestamp_seconds', 'gauge',
+     'Time the device readings were sampled at, in seconds since the '
+     'epoch.'),
+)
+LAST_SUCCESS = 'miccheck_test_last_success_timestamp_seconds'
+# family of each field of micdevice.Telemetry
+TELEMETRY_FAMILIES = (
+    ('die_temp', 'miccheck_device_die_temperature_celsius'),
+    ('fan_rpm', 'miccheck_device_fan_rpm'),
+    ('fan_pwm', 'miccheck_device_fan_pwm_percent'),
+    ('power', 'miccheck_device_power_watts'),
+    ('thermal_throttle', 'miccheck_device_thermal_throttled'),
+    ('power_throttle', 'miccheck_device_power_throttled'),
+)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n',
+                                                                   '\\n')
+
+
+def _labels(device, test=None):
+    labels = 'device="%s"' % ('mic%d' % device if device != -1 else 'host')
+
+    if test is not None:
+        labels = 'test="%s",%s' % (_escape(test), labels)
+    return labels
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    elif isinstance(value, (int, long)):
+        return str(value)
+    return repr(value)
+
+
+class Exporter:
+    """The latest results of the tests and readings of the devices, in the
+    OpenMetrics text format. Each sample line is rendered when its value
+    changes and kept, so render() only joins strings, and only once per
+    change: it never probes anything, and costs the same whatever the tests
+    and devices cost to check."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = dict((name, collections.OrderedDict())
+                            for name, _, _ in FAMILIES)
+        self._headers = dict((name, '# TYPE %s %s\n# HELP %s %s\n' %
+                              (name, kind, name, help_text))
+                             for name, kind, help_text in FAMILIES)
+        self._changes = 0
+        self._rendered = None
+
+    def _set(self, family, labels, value):
+        self._series[family][labels] = '%s{%s} %s\n' % (family, labels,
+                                                        _value(value))
+
+    def update_result(self, test, device, passed, duration, end):
+        labels = _labels(device, test)
+
+        with self._lock:
+            self._set('miccheck_test_passed', labels, passed)
+            self._set('miccheck_test_duration_seconds', labels, duration)
+
+            if passed:
+                self._set(LAST_SUCCESS, labels, end)
+            self._changes += 1
+
+    def update_telemetry(self, device, sample_time, telemetry):
+        labels = _labels(device)
+
+        with self._lock:
+            for field, family in TELEMETRY_FAMILIES:
+                self._set(family, labels, getattr(telemetry, field))
+            self._set('miccheck_device_telemetry_timestamp_seconds', labels,
+                      sample_time)
+            self._changes += 1
+
+    def changes(self):
+        """Returns a number which changes whenever the metrics do"""
+        with self._lock:
+            return self._changes
+
+    def load_last_successes(self, path):
+        """Takes the times the tests last passed from the textfile at path,
+        written by a previous run, so that they survive a failed run"""
+        prefix = LAST_SUCCESS + '{'
+
+        try:
+            with open(path) as textfile:
+                lines = [line for line in textfile
+                         if line.startswith(prefix)]
+        except IOError:
+            return
+
+        with self._lock:
+            for line in lines:
+                labels = line[len(prefix):line.rfind('}')]
+                self._series[LAST_SUCCESS].setdefault(labels, line)
+            self._changes += 1
+
+    def render(self):
+        with self._lock:
+            if self._rendered is not None and \
+                    self._rendered[0] == self._changes:
+                return self._rendered[1]
+
+            chunks = []
+            for name, _, _ in FAMILIES:
+                lines = self._series[name]
+
+                if lines:
+                    chunks.append(self._headers[name])
+                    chunks.extend(lines.itervalues())
+
+            chunks.append('# EOF\n')
+            self._rendered = (self._changes, ''.join(chunks))
+            return self._rendered[1]
+
+    def write_textfile(self, path):
+        """Writes the metrics to path for the textfile collector of
+        node_exporter, replacing the previous file at once"""
+        text = self.render()
+
+        def write(textfile):
+            # node_exporter usually runs as another user
+            os.fchmod(textfile.fileno(), 0644)
+            textfile.write(text)
+
+        cache.replace_atomically(path, write)
+
+
+class TextfileWriter:
+    """Rewrites the textfile of an Exporter every interval seconds while
+    the metrics change, and once more when stopped"""
+    def __init__(self, exporter, path, interval=TEXTFILE_INTERVAL):
+        self._exporter = exporter
+        self._path = path
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self._written = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+        self._write()
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self._write()
+
+    def _write(self):
+        changes = self._exporter.changes()
+
+        if changes == self._written:
+            return
+
+        try:
+            self._exporter.write_textfile(self._path)
+            self._written = changes
+        except (IOError, OSError), excp:
+            prnt.p_err('Metrics could not be written to %s: %s' %
+                       (self._path, excp))
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.exporter.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        prnt.p_out_debug('Metrics scrape from %s: %s' %
+                         (self.client_address[0], fmt % args))
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    """Serves the metrics of an Exporter at http://address:port/metrics from
+    a thread of its own"""
+    def __init__(self, exporter, port, address=DEFAULT_ADDRESS):
+        self._server = _Server((address, port), _Handler)
+        self._server.exporter = exporter
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        prnt.p_out('Serving metrics on http://%s:%d/metrics' %
+                   self._server.server_address)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
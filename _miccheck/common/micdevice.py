@@ -30,30 +30,39 @@
 # license agreement provided with this code and agreed upon with Intel,
 # no license, express or implied, by estoppel or otherwise, to any
 # intellectual property rights is granted herein.
+import collections
 import ctypes
-import platform
+from _miccheck.common import libmicmgmt
+from _miccheck.common.libmicmgmt import E_MIC_SUCCESS
 
-E_MIC_SUCCESS = 0
 MAX_STRLEN = 512
 
-if platform.system() == "Linux":
-    MICMGMT_LIBRARY = "libmicmgmt.so.0"
-else:
-    MICMGMT_LIBRARY = "micmgmt.dll"
+# die_temp in degrees Celsius, fan_rpm in revolutions per minute, fan_pwm
+# the duty cycle of the fan in percent, power the total drawn in Watts, and
+# whether the device is throttled to stay within its thermal or power limits
+Telemetry = collections.namedtuple('Telemetry', (
+    'die_temp', 'fan_rpm', 'fan_pwm', 'power', 'thermal_throttle',
+    'power_throttle'))
 
 class MicDevice:
     def __init__(self, dev_num):
-        self.mic = ctypes.cdll.LoadLibrary(MICMGMT_LIBRARY)
-        self.dev_num = ctypes.c_int(dev_num)
-        self.mdh = ctypes.POINTER(ctypes.c_void_p)()
+        self._is_open = False
+        self.mic = libmicmgmt.library()
+        self.dev_num = ctypes.c_uint32(dev_num)
+        self.mdh = ctypes.c_void_p()
         if self.mic.mic_open_device(ctypes.byref(self.mdh), self.dev_num) != E_MIC_SUCCESS:
             raise LookupError("device %d could not be initialized" % 
 	                      self.dev_num.value)
+        self._is_open = True
 
     def __del__(self):
-        if not hasattr(self, "mic"):
+        self.close()
+
+    def close(self):
+        if not getattr(self, "_is_open", False):
             return
 
+        self._is_open = False
         self.mic.mic_close_device(self.mdh)
 
     def mic_is_ras_avail(self):
@@ -62,9 +71,9 @@ class MicDevice:
         return bool(enabled.value)
 
     def mic_get_smc_fwversion(self):
-        size = ctypes.c_long(MAX_STRLEN)
+        size = ctypes.c_size_t(MAX_STRLEN)
         fwversion = ctypes.create_string_buffer(MAX_STRLEN)
-        thermal_struct = ctypes.POINTER(ctypes.c_void_p)()
+        thermal_struct = ctypes.c_void_p()
 
         if self.mic.mic_get_thermal_info(self.mdh,
                                          ctypes.byref(thermal_struct)) \
@@ -72,20 +81,85 @@ class MicDevice:
             raise RuntimeError("failed to get thermal information")
 
         if self.mic.mic_get_smc_fwversion(thermal_struct,
-                                          ctypes.byref(fwversion),
+                                          fwversion,
                                           ctypes.byref(size)) != E_MIC_SUCCESS:
             self.mic.mic_free_thermal_info(thermal_struct)
             raise RuntimeError("failed to get smc firmware version")
 
         self.mic.mic_free_thermal_info(thermal_struct)
         return fwversion.value
+
+    def mic_get_telemetry(self):
+        """Returns the Telemetry of the device, reading each of the
+        thermal, power and throttle state infos once"""
+        die_temp = ctypes.c_uint32()
+        fan_rpm = ctypes.c_uint32()
+        fan_pwm = ctypes.c_uint32()
+        thermal_struct = ctypes.c_void_p()
+
+        if self.mic.mic_get_thermal_info(self.mdh,
+                                         ctypes.byref(thermal_struct)) \
+                                            != E_MIC_SUCCESS:
+            raise RuntimeError("failed to get thermal information")
+
+        try:
+            if self.mic.mic_get_die_temp(thermal_struct,
+                                         ctypes.byref(die_temp)) \
+                    != E_MIC_SUCCESS or \
+                    self.mic.mic_get_fan_rpm(thermal_struct,
+                                             ctypes.byref(fan_rpm)) \
+                    != E_MIC_SUCCESS or \
+                    self.mic.mic_get_fan_pwm(thermal_struct,
+                                             ctypes.byref(fan_pwm)) \
+                    != E_MIC_SUCCESS:
+                raise RuntimeError("failed to read thermal sensors")
+        finally:
+            self.mic.mic_free_thermal_info(thermal_struct)
+
+        # reported in microwatts
+        power = ctypes.c_uint32()
+        power_struct = ctypes.c_void_p()
+
+        if self.mic.mic_get_power_utilization_info(
+                self.mdh, ctypes.byref(power_struct)) != E_MIC_SUCCESS:
+            raise RuntimeError("failed to get power utilization information")
+
+        try:
+            if self.mic.mic_get_total_power_readings_w0(
+                    power_struct, ctypes.byref(power)) != E_MIC_SUCCESS:
+                raise RuntimeError("failed to read total power")
+        finally:
+            self.mic.mic_free_power_utilization_info(power_struct)
+
+        thermal_ttl = ctypes.c_int()
+        power_ttl = ctypes.c_int()
+        throttle_struct = ctypes.c_void_p()
+
+        if self.mic.mic_get_throttle_state_info(
+                self.mdh, ctypes.byref(throttle_struct)) != E_MIC_SUCCESS:
+            raise RuntimeError("failed to get throttle state information")
+
+        try:
+            if self.mic.mic_get_thermal_ttl_active(
+                    throttle_struct, ctypes.byref(thermal_ttl)) \
+                    != E_MIC_SUCCESS or \
+                    self.mic.mic_get_power_ttl_active(
+                        throttle_struct, ctypes.byref(power_ttl)) \
+                    != E_MIC_SUCCESS:
+                raise RuntimeError("failed to read throttle state")
+        finally:
+            self.mic.mic_free_throttle_state_info(throttle_struct)
+
+        return Telemetry(die_temp.value, fan_rpm.value, fan_pwm.value,
+                         power.value / 1e6, bool(thermal_ttl.value),
+                         bool(power_ttl.value))
     
     @staticmethod
     def mic_get_ndevices():
         """Returns the number of active cards"""
-        mic = ctypes.cdll.LoadLibrary(MICMGMT_LIBRARY)
+        mic = libmicmgmt.library()
         count = ctypes.c_int()
-        device_list = ctypes.POINTER(ctypes.c_void_p)()
+        device_list = ctypes.c_void_p()
 
         if mic.mic_get_devices(ctypes.byref(device_list)) != E_MIC_SUCCESS:
             raise LookupError("could not allocate list of devices available")
@@ -30,26 +30,54 @@
 # license agreement provided with this code and agreed upon with Intel,
 # no license, express or implied, by estoppel or otherwise, to any
 # intellectual property rights is granted herein.
+import functools
 import logging
 import sys
+import threading
 
+out_handler = logging.StreamHandler(sys.stdout)
 out_log = logging.getLogger('out')
-out_log.addHandler(logging.StreamHandler(sys.stdout))
+out_log.addHandler(out_handler)
 out_log.setLevel(logging.INFO)
 
 err_log = logging.getLogger('err')
 err_log.addHandler(logging.StreamHandler(sys.stderr))
 err_log.setLevel(logging.ERROR)
 
+_held = threading.local()
+
+def hold_output():
+    """Holds back the output of the calling thread until release_output()"""
+    _held.output = []
+
+def release_output():
+    """Stops holding back the output of the calling thread, and returns
+    what was held as a list of callables printing it when called in order"""
+    output = _held.output
+    _held.output = None
+    return output
+
+def defer(func, *args):
+    """Calls func(*args) now, or when the held output is printed"""
+    output = getattr(_held, 'output', None)
+
+    if output is None:
+        func(*args)
+    else:
+        output.append(functools.partial(func, *args))
+
 def p_out(msg):
-    out_log.log(logging.INFO, msg)
+    defer(out_log.log, logging.INFO, msg)
 
 def p_out_debug(msg):
-    out_log.log(logging.DEBUG, msg)
+    defer(out_log.log, logging.DEBUG, msg)
 
 def set_debug():
     out_log.setLevel(logging.DEBUG)
 
+def set_out_stream(stream):
+    out_handler.stream = stream
+
 def p_err(msg):
-    err_log.log(logging.ERROR, msg)
+    defer(err_log.log, logging.ERROR, msg)
 
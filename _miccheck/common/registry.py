@@ -0,0 +1,193 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+"""Every test miccheck knows about, described without importing it. The
+command line options selecting tests are generated from here, and the
+module of a test is only imported once the test is selected, so a run of
+a few quick tests does not load libmicmgmt or the modules of other tests."""
+import importlib
+import optparse
+import platform
+
+HOST = 'host'
+DEVICE = 'device'
+TAGS = ('fast', 'network', 'firmware')
+
+LINUX_TESTS = '_miccheck.linux.tests'
+WINDOWS_TESTS = '_miccheck.windows.tests'
+COMMON_TESTS = '_miccheck.common.tests'
+# module of the tests of each platform, which also probes its host
+PLATFORM_TESTS = {'Linux': LINUX_TESTS, 'Windows': WINDOWS_TESTS}
+
+
+class TestEntry:
+    """A test as selected on the command line with --<test_id>. scope is
+    HOST or DEVICE, tags are among TAGS, and default tells whether the test
+    runs when neither itself nor any tag is selected. implementations maps
+    each platform the test runs on (as platform.system() names it) to the
+    module and class implementing it, and to the arguments of the class:
+    'device' for the number of the device, and the name of any attribute of
+    the settings, e.g. 'inventory' or 'device_pool'."""
+    def __init__(self, test_id, scope, default, tags, help_text,
+                 implementations):
+        self.test_id = test_id
+        self.scope = scope
+        self.default = default
+        self.tags = tags
+        self.help_text = help_text
+        self._implementations = implementations
+
+    def runs_on(self, system):
+        return system in self._implementations
+
+    def create(self, settings, device=-1, system=platform.system()):
+        module_name, class_name, args = self._implementations[system]
+        test_class = getattr(importlib.import_module(module_name), class_name)
+
+        return test_class(*[device if arg == 'device' else
+                            getattr(settings, arg) for arg in args])
+
+
+# in the order the tests run
+REGISTRY = [
+    TestEntry('pci_numdev', HOST, True, ('fast',),
+              'Check whether Intel(R) Xeon Phi(TM) coprocessors are detected '
+              'over PCI',
+              {'Linux': (LINUX_TESTS, 'PciDevicesTest', ('inventory',)),
+               'Windows': (WINDOWS_TESTS, 'PciDevicesTest', ('inventory',))}),
+    TestEntry('driver_loaded', HOST, True, ('fast',),
+              'Check whether Intel(R) Xeon Phi(TM) driver is loaded in the '
+              'host',
+              {'Linux': (LINUX_TESTS, 'MicDriverTest', ('inventory',)),
+               'Windows': (WINDOWS_TESTS, 'MicDriverTest', ('inventory',))}),
+    TestEntry('driver_numdev', HOST, True, (),
+              'Check whether driver detected the same number of devices as '
+              'PCI enumeration did',
+              {'Linux': (LINUX_TESTS, 'ScifDevicesTest', ('inventory',)),
+               'Windows': (WINDOWS_TESTS, 'WmiDevicesTest', ('inventory',))}),
+    TestEntry('mpssd_loaded', HOST, True, ('fast',),
+              'Check whether MPSS daemon is running',
+              {'Linux': (LINUX_TESTS, 'MpssRunTest', ('inventory',))}),
+    TestEntry('driver_ver', HOST, False, ('fast',),
+              'Check whether loaded driver version is correct',
+              {'Linux': (LINUX_TESTS, 'DriverVersionTest', ('inventory',)),
+               'Windows': (WINDOWS_TESTS, 'DriverVersionTest', ())}),
+    TestEntry('dev_state', DEVICE, True, ('fast',),
+              'Check whether device state is online and its postcode is FF',
+              {'Linux': (LINUX_TESTS, 'StateTest', ('device', 'inventory')),
+               'Windows': (WINDOWS_TESTS, 'StateTest', ('device',))}),
+    TestEntry('dev_rasdaemon', DEVICE, True, (),
+              'Check whether RAS daemon is available in device',
+              {'Linux': (LINUX_TESTS, 'RasTest', ('device', 'device_pool')),
+               'Windows': (WINDOWS_TESTS, 'RasTest',
+                           ('device', 'device_pool'))}),
+    TestEntry('flash_ver', DEVICE, True, ('firmware',),
+              'Check whether running flash version of device is correct',
+              {'Linux': (LINUX_TESTS, 'FlashVersionTest',
+                         ('device', 'device_pool', 'inventory'))}),
+    TestEntry('smc_ver', DEVICE, True, ('firmware',),
+              'Check whether running SMC firmware version of device is '
+              'correct',
+              {'Linux': (COMMON_TESTS, 'SmcFirmwareTest',
+                         ('device', 'device_pool')),
+               'Windows': (COMMON_TESTS, 'SmcFirmwareTest',
+                           ('device', 'device_pool'))}),
+    TestEntry('ping', DEVICE, False, ('network',),
+              'Check whether network interface of device can be pinged',
+              {'Linux': (LINUX_TESTS, 'PingTest', ('device', 'inventory'))}),
+    TestEntry('ssh', DEVICE, False, ('network',),
+              'Check whether network interface of device can be accessed '
+              'through ssh',
+              {'Linux': (LINUX_TESTS, 'SshTest', ('device', 'inventory'))}),
+]
+
+
+def available(system=platform.system()):
+    return [entry for entry in REGISTRY if entry.runs_on(system)]
+
+
+def platform_module(system=platform.system()):
+    """Returns the module of the tests of system, imported on first use"""
+    return importlib.import_module(PLATFORM_TESTS[system])
+
+
+def add_options(group, system=platform.system()):
+    """Adds --<test_id> and --no-<test_id> to the option group for every test
+    available on system"""
+    for entry in available(system):
+        details = ['enabled' if entry.default else 'disabled']
+
+        if entry.tags:
+            details.append('tags: %s' % ', '.join(entry.tags))
+
+        # None tells the test was not chosen on the command line
+        group.add_option('--' + entry.test_id, dest=entry.test_id,
+                         action='store_true', default=None,
+                         help='%s [%s].' % (entry.help_text,
+                                            '; '.join(details)))
+        group.add_option('--no-' + entry.test_id, dest=entry.test_id,
+                         action='store_false', help=optparse.SUPPRESS_HELP)
+
+
+def parse_tags(value):
+    """Returns the set of tags listed, comma separated, in value. Raises
+    ValueError for an unknown tag."""
+    tags = set(tag.strip() for tag in value.split(',') if tag.strip())
+    unknown = tags.difference(TAGS)
+
+    if unknown:
+        raise ValueError('unknown tag(s): %s, tags are: %s' %
+                         (', '.join(sorted(unknown)), ', '.join(TAGS)))
+    return tags
+
+
+def is_selected(entry, settings):
+    """A test chosen on the command line runs as chosen; otherwise it runs
+    if it has one of the selected tags or, when no tag is selected, if it
+    runs by default"""
+    chosen = getattr(settings, entry.test_id, None)
+
+    if chosen is not None:
+        return chosen
+
+    tags = getattr(settings, 'tags', None)
+    if tags:
+        return bool(tags.intersection(entry.tags))
+    return entry.default
+
+
+def tests(settings, scope, default, device=-1):
+    """Returns new instances of the selected tests of scope which run by
+    default, or of those which do not, for device (-1 for the host)"""
+    return [entry.create(settings, device) for entry in available()
+            if entry.scope == scope and entry.default == default and
+            is_selected(entry, settings)]
@@ -0,0 +1,168 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import json
+import socket
+import sys
+import time
+from xml.sax.saxutils import quoteattr
+from _miccheck.common import printing as prnt
+
+FORMATS = ('text', 'jsonl', 'junit')
+
+
+def device_name(device):
+    # if device == -1, it is a host test
+    return 'mic%d' % device if device != -1 else None
+
+
+def timestamp(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def status(result):
+    if result.passed:
+        return 'pass'
+    return 'skip' if result.skipped else 'fail'
+
+
+class TextReporter:
+    """Prints results for humans, as each test finishes"""
+    def start(self):
+        pass
+
+    def report(self, result):
+        if result.device != -1:
+            test_output = ('  Test %d (mic%d): %s' % (result.number,
+                                                      result.device,
+                                                      result.description))
+        else:
+            test_output = '  Test %d: %s' % (result.number, result.description)
+
+        if result.passed:
+            test_output += ' ... pass'
+
+            if result.cached:
+                test_output += ' (cached)'
+        elif result.skipped:
+            test_output += ' ... %s' % result.message
+        else:
+            test_output += ' ... fail\n    %s' % result.message
+
+        prnt.p_out(test_output)
+
+    def finish(self, passed):
+        pass
+
+
+class JsonLinesReporter:
+    """Writes one JSON object per result to stream as each test finishes,
+    and a summary object once all tests finished"""
+    def __init__(self, stream=sys.stdout):
+        self._stream = stream
+        self._host = socket.gethostname()
+
+    def _write(self, record):
+        self._stream.write(json.dumps(record, sort_keys=True) + '\n')
+        self._stream.flush()
+
+    def start(self):
+        pass
+
+    def report(self, result):
+        self._write({'type': 'test',
+                     'host': self._host,
+                     'number': result.number,
+                     'test': result.test,
+                     'device': device_name(result.device),
+                     'description': result.description,
+                     'status': status(result),
+                     'cached': result.cached,
+                     'message': result.message,
+                     'timestamp': timestamp(result.start),
+                     'duration': result.wall_time,
+                     'cpu_time': result.cpu_time,
+                     'subprocesses': result.subprocesses,
+                     'micmgmt_calls': result.micmgmt_calls})
+
+    def finish(self, passed):
+        self._write({'type': 'summary',
+                     'host': self._host,
+                     'status': 'pass' if passed else 'fail',
+                     'timestamp': timestamp(time.time())})
+
+
+class JUnitReporter:
+    """Writes a JUnit XML test suite to stream, one test case at a time as
+    each test finishes"""
+    def __init__(self, stream=sys.stdout):
+        self._stream = stream
+        self._host = socket.gethostname()
+
+    def _write(self, xml):
+        self._stream.write(xml)
+        self._stream.flush()
+
+    def start(self):
+        self._write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<testsuite name="miccheck" hostname=%s timestamp=%s>\n' %
+                    (quoteattr(self._host), quoteattr(timestamp(time.time()))))
+
+    def report(self, result):
+        xml = ('  <testcase classname=%s name=%s time="%.6f" timestamp=%s' %
+               (quoteattr('miccheck.%s' % (device_name(result.device) or
+                                           'host')),
+                quoteattr(result.test), result.wall_time,
+                quoteattr(timestamp(result.start))))
+
+        if result.cached:
+            xml += ('>\n    <system-out>result cached from a previous '
+                    'run</system-out>\n  </testcase>\n')
+        elif result.passed:
+            xml += '/>\n'
+        elif result.skipped:
+            xml += ('>\n    <skipped message=%s/>\n  </testcase>\n' %
+                    quoteattr(result.message))
+        else:
+            xml += ('>\n    <failure message=%s/>\n  </testcase>\n' %
+                    quoteattr(result.message))
+
+        self._write(xml)
+
+    def finish(self, passed):
+        self._write('</testsuite>\n')
+
+
+def create(output_format):
+    return {'text': TextReporter,
+            'jsonl': JsonLinesReporter,
+            'junit': JUnitReporter}[output_format]()
@@ -0,0 +1,274 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import gzip
+import json
+import socket
+import sys
+import threading
+import time
+import _miccheck
+from _miccheck.common import cache
+from _miccheck.common import exceptions as ex
+from _miccheck.common import printing as prnt
+
+SNAPSHOT_VERSION = 1
+
+
+def _type_name(value):
+    return '%s.%s' % (type(value).__module__, type(value).__name__)
+
+
+def _find_type(name):
+    # only types of modules miccheck already imported are rebuilt
+    module, _, name = name.rpartition('.')
+    return getattr(sys.modules.get(module), name, None)
+
+
+def encode(value):
+    """Returns value as json data. Besides the types json supports, values
+    can be exceptions, named tuples and dictionaries with keys of any of
+    these types. TypeError is raised for values of other types."""
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+
+    if value is None or isinstance(value, (bool, int, long, float, unicode)):
+        return value
+
+    if isinstance(value, BaseException):
+        return {'error': _type_name(value),
+                'args': [encode(arg) for arg in value.args]}
+
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        return {'tuple': _type_name(value),
+                'fields': [encode(field) for field in value]}
+
+    if isinstance(value, dict):
+        return {'dict': [[encode(key), encode(item)]
+                         for key, item in value.items()]}
+
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+
+    raise TypeError('values of type %s cannot be captured' %
+                    type(value).__name__)
+
+
+def decode(data):
+    """Returns the value encoded as data by encode()"""
+    if isinstance(data, unicode):
+        return data.encode('utf-8')
+
+    if isinstance(data, list):
+        return [decode(item) for item in data]
+
+    if not isinstance(data, dict):
+        return data
+
+    if 'dict' in data:
+        return dict((decode(key), decode(item)) for key, item in data['dict'])
+
+    if 'tuple' in data:
+        tuple_type = _find_type(data['tuple'])
+
+        if not (isinstance(tuple_type, type) and
+                issubclass(tuple_type, tuple)):
+            raise ValueError('unknown type %s' % data['tuple'])
+        fields = [decode(field) for field in data['fields']]
+        # fields added since the snapshot was captured were not read
+        fields += [None] * (len(getattr(tuple_type, '_fields', fields)) -
+                            len(fields))
+        return tuple_type(*fields)
+
+    args = [decode(arg) for arg in data['args']]
+    error_type = _find_type(data['error'])
+
+    if isinstance(error_type, type) and issubclass(error_type, Exception):
+        try:
+            return error_type(*args)
+        except TypeError:
+            pass
+    return RuntimeError(*args)
+
+
+def _call_key(name, args):
+    return '%s(%s)' % (name, ', '.join(repr(arg) for arg in args))
+
+
+class Capture:
+    """Records the state probed by a run: the response of every probe of
+    the host inventory and of every call into the devices, with the time it
+    was made at and the seconds it took. Values holding resources rather
+    than state (e.g. open files) are not recorded, the values probed from
+    them are."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._time = time.time()
+        self._probes = {}
+        self._devices = {}
+
+    def probe(self, name, probe):
+        """Wraps a probe of the host inventory (see
+        HostInventory.wrap_probes)"""
+        return lambda: self._record(self._probes, name, probe, ())
+
+    def device(self, dev_num, open_device):
+        """Opens a device of the pool (see MicDevicePool.wrap_devices)"""
+        with self._lock:
+            entries = self._devices.setdefault(str(dev_num), {})
+
+        # only whether the device opened is recorded, not its handle
+        opened = []
+        self._record(entries, 'open', lambda: opened.append(open_device()),
+                     ())
+        return _CapturedDevice(
+            opened[0],
+            lambda name, method, args:
+                self._record(entries, _call_key(name, args), method, args))
+
+    def _record(self, entries, key, function, args):
+        start = time.time()
+
+        try:
+            value = function(*args)
+        except Exception, excp:
+            entry = {'error': encode(excp)}
+            entry.update(time=start, latency=time.time() - start)
+            with self._lock:
+                entries[key] = entry
+            raise
+
+        entry = {'time': start, 'latency': time.time() - start}
+        try:
+            entry['value'] = encode(value)
+        except TypeError, excp:
+            prnt.p_out_debug('%s is not captured: %s' % (key, excp))
+            return value
+
+        with self._lock:
+            entries[key] = entry
+        return value
+
+    def save(self, path):
+        with self._lock:
+            data = {'version': SNAPSHOT_VERSION,
+                    'miccheck': _miccheck.__version__,
+                    'host': socket.gethostname(),
+                    'time': self._time,
+                    'probes': self._probes,
+                    'devices': self._devices}
+
+        cache.write_atomically(path, data, compress=True)
+
+
+class _CapturedDevice:
+    def __init__(self, device, record):
+        self._device = device
+        self._record = record
+
+    def close(self):
+        self._device.close()
+
+    def __getattr__(self, name):
+        if not name.startswith('mic_'):
+            raise AttributeError(name)
+
+        method = getattr(self._device, name)
+        return lambda *args: self._record(name, method, args)
+
+
+class Replay:
+    """Answers the probes of a run with the responses recorded by Capture
+    in the snapshot file at path, without accessing the host or devices.
+    A test needing state which was not captured fails."""
+    def __init__(self, path):
+        try:
+            with gzip.open(path) as snapshot_file:
+                data = json.load(snapshot_file)
+        except (IOError, ValueError), excp:
+            raise IOError('%s could not be read: %s' % (path, excp))
+
+        if not isinstance(data, dict) or \
+                data.get('version') != SNAPSHOT_VERSION:
+            raise IOError('%s is not a snapshot of this miccheck version' %
+                          path)
+
+        self.host = data['host']
+        self.time = data['time']
+        self.version = data['miccheck']
+        self._path = path
+        self._probes = data['probes']
+        self._devices = data['devices']
+
+    def probe(self, name, probe):
+        """Replaces a probe of the host inventory (see
+        HostInventory.wrap_probes)"""
+        return lambda: self._replay(self._probes, name,
+                                    '%s of the host' % name)
+
+    def device(self, dev_num, open_device):
+        """Opens a device of the pool (see MicDevicePool.wrap_devices)"""
+        entries = self._devices.get(str(dev_num))
+
+        if entries is None:
+            raise LookupError('device %d was not captured' % dev_num)
+
+        self._replay(entries, 'open', 'opening device mic%d' % dev_num)
+        return _ReplayedDevice(
+            lambda name, args: self._replay(entries, _call_key(name, args),
+                                            '%s of device mic%d' %
+                                            (name, dev_num)))
+
+    def _replay(self, entries, key, description):
+        entry = entries.get(key)
+
+        if entry is None:
+            raise ex.FailedTestException('%s was not captured in %s' %
+                                         (description, self._path))
+
+        if 'error' in entry:
+            raise decode(entry['error'])
+        return decode(entry['value'])
+
+
+class _ReplayedDevice:
+    def __init__(self, replay):
+        self._replay = replay
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        if not name.startswith('mic_'):
+            raise AttributeError(name)
+
+        return lambda *args: self._replay(name, args)
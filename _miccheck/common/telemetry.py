@@ -0,0 +1,251 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import array
+import bisect
+import collections
+import threading
+import time
+from _miccheck.common import defaults
+from _miccheck.common import printing as prnt
+
+DEFAULT_SIZE = defaults.TELEMETRY_SIZE
+MAX_RATE = defaults.TELEMETRY_MAX_RATE
+# seconds a device whose telemetry could not be read is left alone, so a
+# hung device does not hold up the sampling of the others at every round
+RETRY_INTERVAL = 30
+# seconds of the latest samples summarized when no window is given
+DEFAULT_WINDOW = 60
+
+# metrics of MicDevice.mic_get_telemetry(), with the array typecode their
+# samples are kept as. The summary of a throttle flag is the fraction of the
+# samples in which the device was throttled.
+METRICS = (('die_temp', 'H'), ('fan_rpm', 'I'), ('fan_pwm', 'B'),
+           ('power', 'f'), ('thermal_throttle', 'B'), ('power_throttle', 'B'))
+FLAGS = ('thermal_throttle', 'power_throttle')
+
+Summary = collections.namedtuple('Summary', ('min', 'max', 'mean', 'p50',
+                                             'p95'))
+
+
+def percentile(values, fraction):
+    """Returns the value below which fraction of the sorted values are"""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(values):
+    values = sorted(values)
+    return Summary(values[0], values[-1], float(sum(values)) / len(values),
+                   percentile(values, 0.5), percentile(values, 0.95))
+
+
+class RingBuffer:
+    """The latest size values, kept in a preallocated array of typecode so
+    that appending allocates nothing"""
+    def __init__(self, size, typecode='d'):
+        self._values = array.array(typecode, [0]) * size
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % len(self._values)
+        self._count = min(self._count + 1, len(self._values))
+
+    def latest(self, count=None):
+        """Returns the latest count values, or all of them, oldest first"""
+        if count is None or count > self._count:
+            count = self._count
+
+        start = self._next - count
+        if start >= 0:
+            return self._values[start:self._next].tolist()
+        return (self._values[start:] + self._values[:self._next]).tolist()
+
+
+class DeviceTelemetry:
+    """Samples of one device: a ring buffer of the sample times and one per
+    metric, filled at the same index. Sampling and reading may happen in
+    different threads."""
+    def __init__(self, size=DEFAULT_SIZE):
+        self._times = RingBuffer(size, 'd')
+        self._metrics = [(name, RingBuffer(size, typecode))
+                         for name, typecode in METRICS]
+        self._lock = threading.Lock()
+        self.errors = 0
+        self.retry_at = 0
+
+    def add(self, sample_time, telemetry):
+        with self._lock:
+            self._times.append(sample_time)
+
+            for name, ring in self._metrics:
+                ring.append(getattr(telemetry, name))
+
+    def latest(self):
+        """Returns the time and values of the latest sample as a dict, or
+        None if there is none"""
+        with self._lock:
+            if not self._times:
+                return None
+
+            sample = dict((name, ring.latest(1)[0])
+                          for name, ring in self._metrics)
+            sample['time'] = self._times.latest(1)[0]
+            return sample
+
+    def summary(self, seconds, now=None):
+        """Returns the number of samples of the last seconds, and a dict
+        mapping each metric to the Summary of those samples. The dict is
+        empty if there are none."""
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            times = self._times.latest()
+            count = len(times) - bisect.bisect_left(times, now - seconds)
+            values = [(name, ring.latest(count))
+                      for name, ring in self._metrics]
+
+        if not count:
+            return 0, {}
+        return count, dict((name, summarize(samples))
+                           for name, samples in values)
+
+
+class Sampler:
+    """Samples the telemetry of the devices rate times per second, until
+    stopped, and reports each device entering or leaving a throttled
+    state. on_sample, if given, is called with the device, the time and
+    the Telemetry of every sample."""
+    def __init__(self, device_pool, devices, rate, size=DEFAULT_SIZE,
+                 on_sample=None):
+        self._device_pool = device_pool
+        self._on_sample = on_sample
+        self._interval = 1.0 / rate
+        self._stopped = threading.Event()
+        self._thread = None
+        self._devices = collections.OrderedDict(
+            (device, DeviceTelemetry(size)) for device in devices)
+
+    def start(self):
+        """Samples in a thread of its own until stop() is called"""
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        due = time.time()
+
+        try:
+            while not self._stopped.is_set():
+                for device, telemetry in self._devices.items():
+                    if time.time() >= telemetry.retry_at:
+                        self._sample(device, telemetry)
+
+                # a round longer than the interval delays the next one
+                # rather than starting rounds back to back
+                due = max(due + self._interval, time.time())
+                self._stopped.wait(due - time.time())
+        except KeyboardInterrupt:
+            pass
+
+    def _sample(self, device, telemetry):
+        try:
+            sample = self._device_pool.get(device).mic_get_telemetry()
+        except Exception, excp:
+            telemetry.errors += 1
+            telemetry.retry_at = time.time() + RETRY_INTERVAL
+            prnt.p_out_debug('Telemetry of mic%d could not be read: %s' %
+                             (device, excp))
+            return
+
+        sample_time = time.time()
+        previous = telemetry.latest()
+        telemetry.add(sample_time, sample)
+
+        if self._on_sample:
+            self._on_sample(device, sample_time, sample)
+
+        for flag in FLAGS:
+            if previous is not None and \
+                    bool(previous[flag]) != getattr(sample, flag):
+                prnt.p_out('  [%s] (mic%d): %s %s' % (
+                    time.strftime('%Y-%m-%d %H:%M:%S'), device,
+                    flag.replace('_', ' '),
+                    'started' if getattr(sample, flag) else 'stopped'))
+
+    def report(self, seconds=DEFAULT_WINDOW, devices=None):
+        """Returns one line per device, or per device in devices,
+        summarizing its samples of the last seconds (see describe())"""
+        if devices is None:
+            devices = self._devices.keys()
+
+        lines = []
+        for device in devices:
+            telemetry = self._devices.get(device)
+
+            if telemetry is None:
+                lines.append('mic%d unknown' % device)
+            else:
+                lines.append(describe(device, *telemetry.summary(seconds)))
+        return lines
+
+
+def describe(device, count, summaries):
+    """Returns a line like 'mic0 samples=60 die_temp=50/52.3/55/56 ...',
+    giving min/mean/p95/max of each metric and the throttled fraction of
+    the samples for the throttle flags, or 'mic0 unknown' without
+    samples"""
+    if not count:
+        return 'mic%d unknown' % device
+
+    fields = ['mic%d' % device, 'samples=%d' % count]
+    for name, _ in METRICS:
+        summary = summaries[name]
+
+        if name in FLAGS:
+            fields.append('%s=%.2f' % (name, summary.mean))
+        else:
+            fields.append('%s=%g/%.1f/%g/%g' % (name, summary.min,
+                                                summary.mean, summary.p95,
+                                                summary.max))
+    return ' '.join(fields)
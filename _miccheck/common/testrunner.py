@@ -30,31 +30,303 @@
 # license agreement provided with this code and agreed upon with Intel,
 # no license, express or implied, by estoppel or otherwise, to any
 # intellectual property rights is granted herein.
-from _miccheck.common import exceptions as ex
-from _miccheck.common import printing as prnt 
+import collections
+import heapq
+import sys
+import threading
+import time
+from _miccheck.common import accounting
+from _miccheck.common import printing as prnt
+from _miccheck.common import reporters
+
+# test is the name of the test class, device is -1 for host tests. times are
+# in seconds, cpu_time being the cpu time of the thread running the test.
+# cached is True when the result was reused from a previous run, skipped
+# when the test did not run because a prerequisite did not pass
+TestResult = collections.namedtuple('TestResult', (
+    'number', 'test', 'device', 'description', 'passed', 'message', 'start',
+    'wall_time', 'cpu_time', 'subprocesses', 'micmgmt_calls', 'cached',
+    'skipped'))
+
+# outcomes of the tests of a plan
+PASS, FAIL, SKIP = 'pass', 'fail', 'skip'
+
 
 class TestRunner:
-    def __init__(self):
+    def __init__(self, reporter=None, cache=None, skip=()):
         self._num_tests_run = 0
+        self._reporter = reporter or reporters.TextReporter()
+        # tests setting cacheable are skipped while their last pass is cached
+        self._cache = cache
+        # (test, device) of the tests not to run at all, e.g. those which
+        # passed in the last run when only failed tests are run again
+        self._skip = skip
+        self.results = []
+        self._reporter.start()
+
+    def finish(self, passed):
+        self._reporter.finish(passed)
 
     def run(self, test, device=-1):
+        test_id = test.__class__.__name__
+        msg = test.msg_executing()
+
+        if (test_id, device) in self._skip:
+            prnt.p_out_debug('Skipping %s, it passed in the last run' % msg)
+            return
+
+        cacheable = self._cache is not None and getattr(test, 'cacheable',
+                                                        False)
+        cached = False
+        passed = False
+        message = None
+        start = time.time()
+        cpu_start = accounting.cpu_time()
+
+        with accounting.Usage() as usage:
+            try:
+                cached = cacheable and self._cache.lookup(test_id, device)
+
+                if not cached:
+                    test.run()
+
+                    if cacheable:
+                        self._cache.store(test_id, device)
+                passed = True
+            except Exception, excp:
+                message = str(excp)
+                raise
+            finally:
+                usage = (time.time() - start,
+                         accounting.cpu_time() - cpu_start,
+                         usage.subprocesses, usage.micmgmt_calls, cached)
+                # when the output is held back, the test gets its number once
+                # the output is printed, so numbering follows the printed order
+                prnt.defer(self._record, test_id, device, msg, passed,
+                           message, start, usage)
+
+    def _record(self, test, device, msg, passed, message, start, usage,
+                skipped=False):
+        result = TestResult(self._num_tests_run, test, device, msg, passed,
+                            message, start, *usage, skipped=skipped)
+        self.results.append(result)
+        self._num_tests_run += 1
+        self._reporter.report(result)
+
+    def print_timings(self):
+        prnt.p_out('\nTimings, slowest first:')
+
+        for result in sorted(self.results, key=lambda r: r.wall_time,
+                             reverse=True):
+            if result.device != -1:
+                name = 'Test %d (mic%d)' % (result.number, result.device)
+            else:
+                name = 'Test %d' % result.number
+
+            prnt.p_out('  %-16s %s' % (name + ':', _format_usage([result])))
+
+        prnt.p_out('Timings per device:')
+        devices = collections.defaultdict(list)
+        for result in self.results:
+            devices[result.device].append(result)
+
+        for device in sorted(devices):
+            name = 'mic%d' % device if device != -1 else 'host'
+            prnt.p_out('  %-16s %s' % (name + ':',
+                                       _format_usage(devices[device])))
+
+    def report_skipped(self, test, device, reason):
+        prnt.defer(self._record, test.__class__.__name__, device,
+                   test.msg_executing(), False, reason, time.time(),
+                   (0.0, 0.0, 0, 0, False), True)
+
+    def run_plan(self, plan, jobs=1):
+        """Runs the tests of plan, a list of (title, device, tests) groups,
+        on up to jobs threads. A test runs once the tests named (by class) in
+        its prerequisites attribute are done; they are looked for earlier in
+        the plan, on the same device first and then on the host. If one of
+        them did not pass, the test is reported as skipped instead. Tests of
+        the same device never run at the same time, and the output is printed
+        in the order of the plan. Returns the number of tests which failed
+        and the number of tests which were skipped."""
+        nodes = []
+        for title, device, tests in plan:
+            for index, test in enumerate(tests):
+                nodes.append((title if index == 0 else None, device, test))
+
+        prerequisites = _resolve_prerequisites(nodes)
+        outcomes = [None] * len(nodes)
+
+        # a test in skip still runs when a test which runs depends on it,
+        # so a failed test is checked again together with its prerequisites
+        needed = set()
+        for index in reversed(range(len(nodes))):
+            _, device, test = nodes[index]
+
+            if (test.__class__.__name__, device) not in self._skip or \
+                    index in needed:
+                needed.update(prerequisites[index])
+        self._skip = set(self._skip) - set(
+            (nodes[index][2].__class__.__name__, nodes[index][1])
+            for index in needed)
+
+        if jobs <= 1:
+            for index, (title, _, _) in enumerate(nodes):
+                if title:
+                    prnt.p_out(title)
+                outcomes[index] = self._run_node(nodes, prerequisites,
+                                                 outcomes, index)
+        else:
+            self._run_nodes(nodes, prerequisites, outcomes,
+                            min(jobs, len(nodes)))
+
+        return outcomes.count(FAIL), outcomes.count(SKIP)
+
+    def _run_node(self, nodes, prerequisites, outcomes, index):
+        _, device, test = nodes[index]
+        not_passed = [nodes[prerequisite][2].__class__.__name__
+                      for prerequisite in prerequisites[index]
+                      if outcomes[prerequisite] != PASS]
+
+        if not_passed:
+            self.report_skipped(test, device, 'skipped, %s did not pass' %
+                                ', '.join(not_passed))
+            return SKIP
+
         try:
-            # if device == -1, it is a host test, so we don't print mic id
-            if device != -1:
-                test_output = ('  Test %d (mic%d): %s' % (self._num_tests_run,
-                                                  device, test.msg_executing()))
+            self.run(test, device)
+            return PASS
+        # the failure is already reported, so the tests which do not depend
+        # on this one can go on
+        except Exception:
+            return FAIL
+
+    def _run_nodes(self, nodes, prerequisites, outcomes, jobs):
+        lock = threading.Lock()
+        # workers wait for tests to become ready, the main thread for the
+        # next test to print
+        work = threading.Condition(lock)
+        done = threading.Condition(lock)
+        waiting = [len(indexes) for indexes in prerequisites]
+        dependents = [[] for _ in nodes]
+        for index, indexes in enumerate(prerequisites):
+            for prerequisite in indexes:
+                dependents[prerequisite].append(index)
+
+        # ready tests are heaps of indexes, so they start in plan order; a
+        # device has one test in ready at most, the others wait for it
+        ready = []
+        device_ready = collections.defaultdict(list)
+        busy_devices = set()
+        results = {}
+        state = {'started': 0}
+
+        def make_ready(index):
+            device = nodes[index][1]
+
+            if device == -1 or device not in busy_devices:
+                busy_devices.add(device)
+                heapq.heappush(ready, index)
             else:
-                test_output = ('  Test %d: %s' % (self._num_tests_run,
-                                              test.msg_executing()))
-
-            test.run()
-            test_output += ' ... pass'
-        except ex.FailedTestException, excp:
-            test_output += ' ... fail\n    %s' % str(excp)
-            raise
-        except Exception, excp:
-            test_output += ' ... fail\n    %s' % str(excp)
-            raise
-        finally:
-            self._num_tests_run += 1
-            prnt.p_out(test_output)
+                heapq.heappush(device_ready[device], index)
+
+        def finished(index):
+            device = nodes[index][1]
+            newly_ready = len(ready)
+
+            if device_ready[device]:
+                heapq.heappush(ready, heapq.heappop(device_ready[device]))
+            else:
+                busy_devices.discard(device)
+
+            for dependent in dependents[index]:
+                waiting[dependent] -= 1
+
+                if not waiting[dependent]:
+                    make_ready(dependent)
+
+            work.notify(len(ready) - newly_ready)
+            done.notify()
+
+        def worker():
+            while True:
+                with lock:
+                    while not ready and state['started'] < len(nodes):
+                        work.wait()
+
+                    if state['started'] == len(nodes):
+                        return
+
+                    index = heapq.heappop(ready)
+                    state['started'] += 1
+
+                    if state['started'] == len(nodes):
+                        # nothing is left to start, idle workers can exit
+                        work.notify_all()
+
+                prnt.hold_output()
+                try:
+                    result = (self._run_node(nodes, prerequisites, outcomes,
+                                             index), None)
+                except Exception:
+                    result = (FAIL, sys.exc_info())
+                output = prnt.release_output()
+
+                with lock:
+                    results[index] = result[1], output
+                    outcomes[index] = result[0]
+                    finished(index)
+
+        with lock:
+            for index in range(len(nodes)):
+                if not waiting[index]:
+                    make_ready(index)
+
+        for _ in range(jobs):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        for index, (title, _, _) in enumerate(nodes):
+            with lock:
+                # waiting with a timeout keeps the main thread interruptible
+                while outcomes[index] is None:
+                    done.wait(1)
+            exc_info, output = results[index]
+
+            if title:
+                prnt.p_out(title)
+
+            for print_output in output:
+                print_output()
+
+            if exc_info:
+                raise exc_info[0], exc_info[1], exc_info[2]
+
+
+def _resolve_prerequisites(nodes):
+    """Returns, for each node, the indexes of the nodes it depends on"""
+    indexes = {}
+    prerequisites = []
+
+    for index, (_, device, test) in enumerate(nodes):
+        found = []
+        for name in getattr(test, 'prerequisites', ()):
+            prerequisite = indexes.get((name, device), indexes.get((name, -1)))
+
+            # prerequisites which are not selected are not waited for
+            if prerequisite is not None:
+                found.append(prerequisite)
+
+        prerequisites.append(found)
+        indexes[(test.__class__.__name__, device)] = index
+
+    return prerequisites
+
+
+def _format_usage(results):
+    return ('%8.1f ms, cpu %7.1f ms, %d subprocesses, %d libmicmgmt calls' %
+            (sum(r.wall_time for r in results) * 1000,
+             sum(r.cpu_time for r in results) * 1000,
+             sum(r.subprocesses for r in results),
+             sum(r.micmgmt_calls for r in results)))
@@ -33,15 +33,19 @@
 import _miccheck
 from _miccheck.common import exceptions as ex
 from _miccheck.common import printing as prnt
-from _miccheck.common.micdevice import MicDevice
 
 # check the smc fw version of the device
 class SmcFirmwareTest:
-    def __init__(self, dev_num):
+    watch_interval = 3600
+    cacheable = True
+    prerequisites = ('StateTest',)
+
+    def __init__(self, dev_num, device_pool):
         self._dev_num = dev_num
+        self._device_pool = device_pool
 
     def run(self): # not static because it is a device test
-        device = MicDevice(self._dev_num)
+        device = self._device_pool.get(self._dev_num)
 
         built_smcver = _miccheck.__smc_fw_version__
         live_smcver = device.mic_get_smc_fwversion()
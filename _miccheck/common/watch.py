@@ -0,0 +1,175 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import heapq
+import itertools
+import random
+import threading
+import time
+from _miccheck.common import printing as prnt
+
+# seconds between two runs of a test which does not set watch_interval
+DEFAULT_INTERVAL = 60
+# each interval is randomly stretched or shrunk by up to this fraction, so
+# hosts started at the same moment drift apart instead of probing together
+JITTER = 0.1
+
+
+class Watcher:
+    """Runs tests over and over, each one every test.watch_interval seconds,
+    and prints the result of a test only when it differs from the previous
+    one. Host state is probed again before each round of due tests. A test
+    whose prerequisites (see TestRunner.run_plan) did not pass in their
+    latest run is skipped, and counts as not passed. The latest outcomes
+    can be read from other threads while it runs, and on_outcome, if given,
+    is called with the test name, device, whether it passed, the seconds it
+    took, the time it finished and whether it was skipped after every
+    run."""
+    def __init__(self, inventory, device_pool, jitter=JITTER,
+                 on_outcome=None):
+        self._inventory = inventory
+        self._device_pool = device_pool
+        self._jitter = jitter
+        self._on_outcome = on_outcome
+        self._queue = []
+        self._order = itertools.count()
+        self._outcomes = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def add(self, test, device=-1):
+        # every test runs once right away, so the first report is complete
+        self._schedule(time.time(), test, device)
+
+    def _schedule(self, due, test, device):
+        heapq.heappush(self._queue, (due, next(self._order), test, device))
+
+    def _interval(self, test):
+        interval = getattr(test, 'watch_interval', DEFAULT_INTERVAL)
+        return interval * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def outcomes(self):
+        """Returns a dict mapping (test name, device) of every test run so
+        far to (passed, message, time of the run)"""
+        with self._lock:
+            return dict(self._outcomes)
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        try:
+            while self._queue and not self._stopped.is_set():
+                delay = self._queue[0][0] - time.time()
+
+                if delay > 0:
+                    self._stopped.wait(delay)
+                    continue
+
+                now = time.time()
+                self._inventory.invalidate()
+
+                while self._queue and self._queue[0][0] <= now:
+                    _, _, test, device = heapq.heappop(self._queue)
+                    self._check(test, device)
+                    self._schedule(now + self._interval(test), test, device)
+        except KeyboardInterrupt:
+            pass
+
+    def _not_passed(self, test, device):
+        """Returns the names of the prerequisites of test whose latest run,
+        on the same device or else on the host, did not pass"""
+        not_passed = []
+
+        with self._lock:
+            for name in getattr(test, 'prerequisites', ()):
+                outcome = self._outcomes.get((name, device),
+                                             self._outcomes.get((name, -1)))
+
+                # prerequisites which are not watched are not waited for
+                if outcome is not None and not outcome[0]:
+                    not_passed.append(name)
+
+        return not_passed
+
+    def _check(self, test, device):
+        start = time.time()
+        not_passed = self._not_passed(test, device)
+        skipped = bool(not_passed)
+
+        if skipped:
+            # e.g. a device which is not online is not opened at all
+            outcome = (False, 'skipped, %s did not pass' %
+                       ', '.join(not_passed))
+        else:
+            try:
+                test.run()
+                outcome = (True, None)
+            except Exception, excp:
+                outcome = (False, str(excp))
+
+                if device != -1:
+                    # the device may have been reset, so its handle is stale
+                    self._device_pool.discard(device)
+
+        end = time.time()
+        key = (test.__class__.__name__, device)
+        with self._lock:
+            previous = self._outcomes.get(key)
+            self._outcomes[key] = outcome + (end,)
+
+        if self._on_outcome:
+            self._on_outcome(key[0], device, outcome[0], end - start, end,
+                             skipped)
+
+        if previous is None or previous[:2] != outcome:
+            self._report(test, device, outcome, skipped)
+
+    @staticmethod
+    def _report(test, device, outcome, skipped=False):
+        passed, msg = outcome
+        output = '  [%s]' % time.strftime('%Y-%m-%d %H:%M:%S')
+
+        # if device == -1, it is a host test, so we don't print mic id
+        if device != -1:
+            output += ' (mic%d)' % device
+
+        output += ': %s' % test.msg_executing()
+
+        if passed:
+            output += ' ... pass'
+        elif skipped:
+            output += ' ... %s' % msg
+        else:
+            output += ' ... fail\n    %s' % msg
+
+        prnt.p_out(output)
@@ -0,0 +1,244 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import errno
+import os
+import signal
+import socket
+import threading
+import time
+from _miccheck.common import defaults
+from _miccheck.common import printing as prnt
+
+SOCKET_PATH = defaults.SOCKET_PATH
+# seconds a client has to send its query
+CLIENT_TIMEOUT = 1
+MAX_QUERY = 4096
+# clients served at once, each by a thread of its own; connections beyond
+# them are closed right away rather than queued behind the others
+MAX_CLIENTS = 64
+
+
+def _terminate(signum, frame):
+    # stop serving the same way as on Ctrl-C, so the socket is removed
+    raise KeyboardInterrupt
+
+
+def health(outcomes, expected):
+    """Returns 'ok', 'unknown' or 'fail <reasons>' for one device (or the
+    host) from the outcomes of its tests, expected being the names of all
+    the tests it should have run"""
+    failures = ['%s: %s' % (name, ' '.join(str(message).split()))
+                for name, (passed, message, _) in sorted(outcomes.items())
+                if not passed]
+
+    if failures:
+        return 'fail ' + '; '.join(failures)
+    elif not expected or not expected.issubset(outcomes):
+        # some test has not run yet
+        return 'unknown'
+    return 'ok'
+
+
+class HealthDaemon:
+    """Keeps checking the host and the devices in the background through a
+    Watcher, and answers status queries over a Unix socket from the latest
+    results, so a query costs no probing at all.
+
+    A query is one line, 'status' optionally followed by device numbers.
+    The answer is one line per target, 'host' first unless devices were
+    given, e.g. 'mic0 ok', 'mic1 fail StateTest: ...' or 'mic2 unknown',
+    and the connection is closed after it. Clients are served at once, so
+    one which is slow to send its query does not delay the others.
+
+    If a telemetry sampler is given, it samples the devices in the
+    background too, and 'telemetry SECONDS' optionally followed by device
+    numbers is answered with one line per device summarizing its samples
+    of the last SECONDS (see telemetry.describe())."""
+    def __init__(self, watcher, devices, path=SOCKET_PATH, sampler=None):
+        self._watcher = watcher
+        self._devices = devices
+        self._path = path
+        self._sampler = sampler
+        self._expected = {}
+        self._socket = None
+        self._client_slots = threading.BoundedSemaphore(MAX_CLIENTS)
+
+    def add(self, test, device=-1):
+        self._watcher.add(test, device)
+        self._expected.setdefault(device, set()).add(test.__class__.__name__)
+
+    def answer(self, query):
+        words = query.split()
+
+        if words and words[0] == 'telemetry':
+            return self._answer_telemetry(words[1:])
+
+        if not words or words[0] != 'status':
+            return 'error unknown query\n'
+
+        try:
+            targets = [int(device) for device in words[1:]]
+        except ValueError:
+            return 'error invalid device\n'
+
+        if not targets:
+            targets = [-1] + self._devices
+
+        by_target = {}
+        for (name, device), outcome in self._watcher.outcomes().items():
+            by_target.setdefault(device, {})[name] = outcome
+
+        lines = []
+        for target in targets:
+            lines.append('%s %s' % ('mic%d' % target if target != -1 else
+                                    'host',
+                                    health(by_target.get(target, {}),
+                                           self._expected.get(target))))
+        return '\n'.join(lines) + '\n'
+
+    def _answer_telemetry(self, args):
+        if self._sampler is None:
+            return 'error telemetry is not sampled\n'
+
+        try:
+            seconds = float(args[0])
+        except (IndexError, ValueError):
+            return 'error invalid window\n'
+
+        try:
+            devices = [int(device) for device in args[1:]] or None
+        except ValueError:
+            return 'error invalid device\n'
+
+        return '\n'.join(self._sampler.report(seconds, devices)) + '\n'
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            sock.bind(self._path)
+        except socket.error, excp:
+            if excp.errno != errno.EADDRINUSE or self._is_alive():
+                sock.close()
+                raise
+            # left behind by a daemon which did not exit cleanly
+            os.unlink(self._path)
+            sock.bind(self._path)
+
+        # anybody may ask, e.g. job prologs running as the user
+        os.chmod(self._path, 0666)
+        sock.listen(socket.SOMAXCONN)
+        return sock
+
+    def _is_alive(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            sock.connect(self._path)
+            return True
+        except socket.error:
+            return False
+        finally:
+            sock.close()
+
+    def _serve_client(self, client):
+        # the whole query must arrive in time, however it is split up
+        deadline = time.time() + CLIENT_TIMEOUT
+        query = ''
+
+        while '\n' not in query and len(query) < MAX_QUERY:
+            remaining = deadline - time.time()
+
+            if remaining <= 0:
+                raise socket.timeout('no query within %d seconds' %
+                                     CLIENT_TIMEOUT)
+            client.settimeout(remaining)
+            data = client.recv(MAX_QUERY)
+
+            if not data:
+                break
+            query += data
+
+        client.settimeout(CLIENT_TIMEOUT)
+        client.sendall(self.answer(query.split('\n', 1)[0]))
+
+    def _handle_client(self, client):
+        try:
+            self._serve_client(client)
+        except socket.error, excp:
+            prnt.p_out_debug('Query failed: %s' % excp)
+        finally:
+            client.close()
+            self._client_slots.release()
+
+    def serve(self):
+        self._socket = self._bind()
+        signal.signal(signal.SIGTERM, _terminate)
+        thread = threading.Thread(target=self._watcher.run)
+        thread.daemon = True
+        thread.start()
+
+        if self._sampler:
+            self._sampler.start()
+        prnt.p_out('Serving health queries on %s' % self._path)
+
+        try:
+            while True:
+                try:
+                    client, _ = self._socket.accept()
+                except socket.error, excp:
+                    if excp.errno == errno.EINTR:
+                        continue
+                    raise
+
+                # a client slow to send its query only holds up itself
+                if not self._client_slots.acquire(False):
+                    prnt.p_out_debug('Query refused, %d clients are being '
+                                     'served' % MAX_CLIENTS)
+                    client.close()
+                    continue
+
+                client_thread = threading.Thread(target=self._handle_client,
+                                                 args=(client,))
+                client_thread.daemon = True
+                client_thread.start()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._watcher.stop()
+
+            if self._sampler:
+                self._sampler.stop()
+            self._socket.close()
+            os.unlink(self._path)
+            thread.join()
@@ -0,0 +1,215 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import json
+import optparse as op
+import sys
+import time
+from _miccheck.common import printing as prnt
+from _miccheck.linux import process
+
+DEFAULT_CONCURRENCY = 64
+# seconds a host has to finish its checks
+DEFAULT_TIMEOUT = 120
+SSH_CONNECT_TIMEOUT = 10
+# exit code of ssh when the connection itself failed
+SSH_ERROR = 255
+# bytes of results kept per host
+MAX_OUTPUT = 1024 * 1024
+
+
+class SshTransport:
+    """Runs miccheck on each host over ssh"""
+    def __init__(self, remote_command):
+        self._remote_command = remote_command.split()
+
+    def command(self, host, args):
+        return (['/usr/bin/ssh', '-oBatchMode=yes',
+                 '-oConnectTimeout=%d' % SSH_CONNECT_TIMEOUT, host] +
+                self._remote_command + ['--format=jsonl'] + args)
+
+    @staticmethod
+    def unreachable(result):
+        return result.returncode == SSH_ERROR
+
+
+class LocalTransport:
+    """Runs miccheck locally once per host, every run checking this very
+    host; meant for testing the fan-out itself. The results are still
+    labelled with the name of each host, as FleetReport does for every
+    transport."""
+    def __init__(self, remote_command):
+        self._remote_command = remote_command.split()
+
+    def command(self, host, args):
+        return self._remote_command + ['--format=jsonl'] + args
+
+    @staticmethod
+    def unreachable(result):
+        return False
+
+
+TRANSPORTS = {'ssh': SshTransport, 'local': LocalTransport}
+
+
+def read_hosts(path):
+    """Reads one host per line, ignoring blank lines and # comments"""
+    hosts = []
+
+    with (sys.stdin if path == '-' else open(path)) as host_file:
+        for line in host_file:
+            host = line.split('#', 1)[0].strip()
+
+            if host:
+                hosts.append(host)
+
+    return hosts
+
+
+def host_status(transport, result):
+    if result.error:
+        return 'error'
+    if result.timed_out:
+        return 'timeout'
+    if transport.unreachable(result):
+        return 'unreachable'
+    if result.returncode == 0:
+        return 'pass'
+    if result.returncode == 1:
+        return 'fail'
+    return 'error'
+
+
+class FleetReport:
+    """Merges the results of all hosts into one JSON Lines stream, written as
+    each host finishes"""
+    def __init__(self, hosts, transport, stream=sys.stdout):
+        self._hosts = hosts
+        self._transport = transport
+        self._stream = stream
+        self.statuses = {}
+
+    def _write(self, record):
+        self._stream.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def host_finished(self, index, result):
+        host = self._hosts[index]
+        status = host_status(self._transport, result)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+        for line in result.stdout.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # not a result, or cut at MAX_OUTPUT
+
+            # the name the host was reached by, not the one it reports
+            record['hostname'] = record.get('host')
+            record['host'] = host
+            self._write(record)
+
+        self._write({'type': 'host', 'host': host, 'status': status,
+                     'exit_code': result.returncode,
+                     'duration': result.duration,
+                     'message': result.stderr.strip().splitlines()[-1]
+                                if result.stderr.strip() else None})
+        self._stream.flush()
+
+    def finish(self, duration):
+        self._write({'type': 'fleet', 'hosts': len(self._hosts),
+                     'statuses': self.statuses, 'duration': duration})
+        self._stream.flush()
+
+
+def parse_command_line(argv):
+    parser = op.OptionParser(
+        usage='%prog [options] HOSTFILE [-- MICCHECK_OPTIONS]',
+        description='Runs miccheck on every host listed in HOSTFILE (- for '
+                    'stdin), a bounded number of hosts at a time, and '
+                    'merges their results into one JSON Lines report on '
+                    'stdout.')
+    parser.add_option('-c', '--concurrency', dest='concurrency', type='int',
+                      default=DEFAULT_CONCURRENCY,
+                      help='Hosts checked at the same time '
+                           '[default=%default].')
+    parser.add_option('-t', '--timeout', dest='timeout', type='int',
+                      default=DEFAULT_TIMEOUT,
+                      help='Seconds a host has to finish its checks '
+                           '[default=%default].')
+    parser.add_option('-T', '--transport', dest='transport', type='choice',
+                      choices=sorted(TRANSPORTS), default='ssh',
+                      help='How miccheck is run on each host: %s '
+                           '[default=%%default].' %
+                           ', '.join(sorted(TRANSPORTS)))
+    parser.add_option('-r', '--remote-command', dest='remote_command',
+                      default='miccheck',
+                      help='Command running miccheck [default=%default].')
+    parser.disable_interspersed_args()
+    settings, args = parser.parse_args(argv)
+
+    if not args:
+        parser.error('HOSTFILE is required')
+
+    if settings.concurrency < 1:
+        parser.error('concurrency must be greater than 0')
+
+    miccheck_args = args[1:]
+    if miccheck_args and miccheck_args[0] == '--':
+        miccheck_args = miccheck_args[1:]
+
+    return settings, args[0], miccheck_args
+
+
+def main(argv=None):
+    settings, host_file, miccheck_args = parse_command_line(
+        sys.argv[1:] if argv is None else argv)
+    # stdout is left to the report
+    prnt.set_out_stream(sys.stderr)
+
+    try:
+        hosts = read_hosts(host_file)
+    except IOError, excp:
+        prnt.p_err('Failure: %s' % excp)
+        return 2
+
+    transport = TRANSPORTS[settings.transport](settings.remote_command)
+    report = FleetReport(hosts, transport)
+    start = time.time()
+
+    process.run_many([transport.command(host, miccheck_args)
+                      for host in hosts], settings.timeout, MAX_OUTPUT,
+                     settings.concurrency, report.host_finished)
+
+    report.finish(time.time() - start)
+    prnt.p_out(', '.join('%d %s' % (count, status) for status, count in
+                         sorted(report.statuses.items())) or 'no hosts')
+    return 0 if report.statuses.get('pass', 0) == len(hosts) else 1
@@ -0,0 +1,129 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import os
+import select
+import socket
+import struct
+import time
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+# type, code, checksum, identifier, sequence number
+ICMP_HEADER = struct.Struct('!BBHHH')
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += '\0'
+
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(ident, seq):
+    payload = 'miccheck'
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0,
+                            checksum(header + payload), ident, seq) + payload
+
+
+def open_socket():
+    """Opens an ICMP socket, unprivileged if the host allows it (see
+    net.ipv4.ping_group_range), raw otherwise. Returns the socket and
+    whether it is raw. Raises socket.error if neither is permitted."""
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                             socket.IPPROTO_ICMP), False
+    except socket.error:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                             socket.IPPROTO_ICMP), True
+
+
+def ping_hosts(hosts, timeout):
+    """Sends one echo request to every host at once, and waits at most
+    timeout seconds in total for the replies. Returns a dict mapping each
+    host to its round trip time in seconds, or to None if it did not reply.
+    Raises socket.error if ICMP sockets are not permitted."""
+    sock, is_raw = open_socket()
+    # unprivileged sockets get their identifier assigned by the kernel, so
+    # replies are matched on the sequence number, which is unique per host
+    ident = os.getpid() & 0xffff
+    rtts = dict((host, None) for host in hosts)
+    pending = {}
+
+    try:
+        for seq, host in enumerate(hosts, 1):
+            try:
+                address = socket.gethostbyname(host)
+                sock.sendto(echo_request(ident, seq), (address, 0))
+            except socket.error:
+                # unknown host or unreachable network, it cannot reply
+                continue
+            pending[seq] = (host, address, time.time())
+
+        deadline = time.time() + timeout
+        while pending:
+            remaining = deadline - time.time()
+
+            if remaining <= 0 or not select.select([sock], [], [],
+                                                   remaining)[0]:
+                break
+
+            data, (address, _) = sock.recvfrom(1024)
+            received = time.time()
+
+            if is_raw:
+                # raw sockets receive the ip header too
+                data = data[(ord(data[0]) & 0x0f) * 4:]
+
+            if len(data) < ICMP_HEADER.size:
+                continue
+
+            icmp_type, _, _, reply_ident, seq = ICMP_HEADER.unpack_from(data)
+
+            # raw sockets receive every icmp packet of the host, including
+            # our own requests on loopback
+            if icmp_type != ICMP_ECHO_REPLY or seq not in pending or \
+                    (is_raw and reply_ident != ident):
+                continue
+
+            host, host_address, sent = pending[seq]
+            if address == host_address:
+                del pending[seq]
+                rtts[host] = received - sent
+    finally:
+        sock.close()
+
+    return rtts
@@ -0,0 +1,66 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import os
+from _miccheck.linux.sysfs import SYSFS_ROOT
+
+INTEL_VENDOR_ID = 0x8086
+
+
+def is_mic_device_id(device_id):
+    # the device id will be always in the range 2250-225f
+    return device_id & 0xfff0 == 0x2250
+
+
+def read_id(path):
+    with open(path) as attrib:
+        return int(attrib.read(), 16)
+
+
+def sysfs_mics_pci(sysfs_root=SYSFS_ROOT):
+    """Returns the sorted BDF addresses (e.g. 0000:84:00.0) of the
+    coprocessors found by walking the PCI devices in sysfs"""
+    devices_dir = os.path.join(sysfs_root, 'bus', 'pci', 'devices')
+    mics = []
+
+    for bdf in os.listdir(devices_dir):
+        device_dir = os.path.join(devices_dir, bdf)
+
+        # almost every device of the host fails the vendor check, so the
+        # device id is only read for intel devices
+        if read_id(os.path.join(device_dir, 'vendor')) != INTEL_VENDOR_ID:
+            continue
+
+        if is_mic_device_id(read_id(os.path.join(device_dir, 'device'))):
+            mics.append(bdf)
+
+    return sorted(mics)
@@ -0,0 +1,251 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import collections
+import errno
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+from _miccheck.common import accounting
+from _miccheck.common import forking
+
+# seconds a program may run before it is killed
+DEFAULT_TIMEOUT = 30
+# bytes kept of each of the stdout and stderr of a program
+MAX_OUTPUT = 64 * 1024
+READ_SIZE = 4096
+# seconds between checks of programs which closed their outputs but did
+# not exit yet
+EXIT_POLL_INTERVAL = 0.01
+
+# environment of the programs run, see child_environment()
+_environment = None
+_environment_lock = threading.Lock()
+
+# returncode is None if the program could not be started, error is then the
+# OSError raised when starting it
+ProcessResult = collections.namedtuple('ProcessResult', (
+    'command', 'returncode', 'stdout', 'stderr', 'duration', 'timed_out',
+    'error'))
+
+
+class _Process:
+    def __init__(self, index, command):
+        self.index = index
+        self.command = command
+        self.start = time.time()
+        self.popen = _spawn(command)
+        accounting.count_subprocess()
+        self.stdout_fd = self.popen.stdout.fileno()
+        self.stderr_fd = self.popen.stderr.fileno()
+        # outputs still open, and what was read from each output
+        self.pipes = {self.stdout_fd: self.popen.stdout,
+                      self.stderr_fd: self.popen.stderr}
+        self.data = {self.stdout_fd: '', self.stderr_fd: ''}
+
+    def read(self, fd, max_output):
+        """Reads from an output, returns False once it is at its end"""
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError, excp:
+            if excp.errno == errno.EINTR:
+                return True
+            data = ''
+
+        # data beyond max_output is still read, so the program never blocks
+        # on a full pipe
+        kept = self.data[fd]
+        if len(kept) < max_output:
+            self.data[fd] = kept + data[:max_output - len(kept)]
+
+        return bool(data)
+
+    def result(self, timed_out):
+        return ProcessResult(self.command, self.popen.returncode,
+                             self.data[self.stdout_fd],
+                             self.data[self.stderr_fd],
+                             time.time() - self.start, timed_out, None)
+
+
+def _strip_bundle_paths(paths):
+    bundle = getattr(sys, '_MEIPASS', None)
+
+    if not getattr(sys, 'frozen', False) or not bundle:
+        return paths
+
+    return os.pathsep.join(
+        path for path in paths.split(os.pathsep)
+        if path and os.path.abspath(path) != bundle and
+        not os.path.abspath(path).startswith(bundle + os.sep))
+
+
+def child_environment():
+    """Returns the environment programs are run with, built once: that of
+    miccheck, less the library paths pyinstaller added to it. The pyinstaller
+    bootloader points LD_LIBRARY_PATH to the libraries it bundles, and if by
+    chance one of them is a library the program needs, the program would
+    pick it up and probably break quite badly. The bootloader keeps the
+    value it replaced in LD_LIBRARY_PATH_ORIG, older ones do not and only
+    their paths are removed."""
+    global _environment
+
+    with _environment_lock:
+        if _environment is None:
+            environment = dict(os.environ)
+
+            if 'LD_LIBRARY_PATH_ORIG' in environment:
+                paths = environment.pop('LD_LIBRARY_PATH_ORIG')
+            else:
+                paths = _strip_bundle_paths(
+                    environment.get('LD_LIBRARY_PATH', ''))
+
+            if paths:
+                environment['LD_LIBRARY_PATH'] = paths
+            else:
+                environment.pop('LD_LIBRARY_PATH', None)
+            _environment = environment
+
+        return _environment
+
+
+def _spawn(command):
+    environment = child_environment()
+
+    with open(os.devnull) as devnull:
+        # Popen is not safe to call from several threads at once in python
+        # 2, two threads starting a program can leave the garbage collector
+        # disabled, and a process forked meanwhile must not inherit the
+        # pipes of the program (see forking.lock)
+        with forking.lock:
+            # the program leads its own process group, so it can be killed
+            # along with anything it started
+            return subprocess.Popen(command, shell=False, stdin=devnull,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, close_fds=True,
+                                    preexec_fn=os.setsid, env=environment)
+
+
+def _kill(proc):
+    try:
+        os.killpg(proc.popen.pid, signal.SIGKILL)
+    except OSError:
+        pass # the program already exited
+
+    proc.popen.wait()
+
+
+def run_many(commands, timeout=DEFAULT_TIMEOUT, max_output=MAX_OUTPUT,
+             concurrency=None, finished=None):
+    """Runs the commands (lists of arguments) at the same time, at most
+    concurrency of them at once if it is not None. Each one is killed, with
+    its whole process group, if it runs longer than timeout seconds. At most
+    max_output bytes of its stdout and of its stderr are kept. Returns a
+    list of ProcessResult in the order of commands. If finished is not None,
+    finished(index, result) is also called as soon as each command ends."""
+    results = [None] * len(commands)
+
+    def finish(index, result):
+        results[index] = result
+
+        if finished is not None:
+            finished(index, result)
+
+    waiting = collections.deque(enumerate(commands))
+    running = []
+    fds = {}
+    poller = select.poll()
+
+    def close_output(proc, fd):
+        poller.unregister(fd)
+        del fds[fd]
+        proc.pipes.pop(fd).close()
+
+    while waiting or running:
+        while waiting and (concurrency is None or len(running) < concurrency):
+            index, command = waiting.popleft()
+
+            try:
+                proc = _Process(index, command)
+            except OSError, excp:
+                finish(index, ProcessResult(command, None, '', str(excp),
+                                            0.0, False, excp))
+                continue
+
+            running.append(proc)
+            for fd in proc.pipes:
+                fds[fd] = proc
+                poller.register(fd, select.POLLIN)
+
+        if not running:
+            break
+
+        wait = min(proc.start + timeout for proc in running) - time.time()
+        if any(not proc.pipes for proc in running):
+            wait = min(wait, EXIT_POLL_INTERVAL)
+
+        try:
+            events = poller.poll(max(0, int(wait * 1000)))
+        except select.error, excp:
+            if excp.args[0] != errno.EINTR:
+                raise
+            events = []
+
+        for fd, _ in events:
+            proc = fds[fd]
+
+            if not proc.read(fd, max_output):
+                close_output(proc, fd)
+
+        now = time.time()
+        for proc in list(running):
+            timed_out = now - proc.start >= timeout
+
+            if timed_out:
+                _kill(proc)
+            elif proc.pipes or proc.popen.poll() is None:
+                continue
+
+            for fd in proc.pipes.keys():
+                close_output(proc, fd)
+
+            running.remove(proc)
+            finish(proc.index, proc.result(timed_out))
+
+    return results
+
+
+def run(command, timeout=DEFAULT_TIMEOUT, max_output=MAX_OUTPUT):
+    return run_many([command], timeout, max_output)[0]
@@ -0,0 +1,106 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import os
+import threading
+
+PROC_ROOT = '/proc'
+
+
+class ProcFs:
+    """Reads state of the host from procfs. Everything read is cached, so a
+    file is read at most once while the reader is in use."""
+    def __init__(self, proc_root=PROC_ROOT):
+        self._root = proc_root
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key, read):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = read()
+
+            return self._cache[key]
+
+    def modules(self):
+        """Returns a dict mapping the name of each loaded kernel module to
+        its state (Live, Loading or Unloading)"""
+        return self._cached('modules', self._read_modules)
+
+    def _read_modules(self):
+        modules = {}
+
+        # each line is similar to:
+        # mic 596637 12 - Live 0xffffffffa0363000
+        with open(os.path.join(self._root, 'modules')) as proc_modules:
+            for line in proc_modules:
+                fields = line.split()
+
+                if len(fields) >= 5:
+                    modules[fields[0]] = fields[4]
+
+        return modules
+
+    def processes(self):
+        """Returns a dict mapping the pid of each running process to its
+        command name"""
+        return self._cached('processes', self._read_processes)
+
+    def _read_processes(self):
+        processes = {}
+
+        for pid in os.listdir(self._root):
+            if not pid.isdigit():
+                continue
+
+            try:
+                with open(os.path.join(self._root, pid, 'comm')) as comm:
+                    processes[int(pid)] = comm.read().rstrip('\n')
+            except IOError:
+                # the process exited while the directory was being walked
+                continue
+
+        return processes
+
+    def boot_id(self):
+        """Returns the random id the kernel picked at boot, which changes
+        on every reboot of the host"""
+        return self._cached('boot_id', self._read_boot_id)
+
+    def _read_boot_id(self):
+        with open(os.path.join(self._root, 'sys', 'kernel', 'random',
+                               'boot_id')) as boot_id:
+            return boot_id.read().strip()
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,133 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+import collections
+import os
+import re
+
+SYSFS_ROOT = '/sys'
+MIC_DIR_RE = re.compile(r'mic(\d+)$')
+# sysfs attributes are at most a page long
+ATTR_SIZE = 4096
+
+# attributes read for every device, and for the driver. boot_count counts
+# the boots of the device since the driver was loaded, resets included
+DEVICE_ATTRS = ('state', 'post_code', 'flashversion', 'boot_count')
+DRIVER_ATTRS = ('version',)
+
+MicRecord = collections.namedtuple('MicRecord', DEVICE_ATTRS)
+DriverRecord = collections.namedtuple('DriverRecord', DRIVER_ATTRS)
+# devices maps the number of each device to its MicRecord
+Snapshot = collections.namedtuple('Snapshot', ('driver', 'devices'))
+
+
+class SysfsReader:
+    """Reads the attributes of the driver and of all the devices in one pass.
+    Attribute files are kept open between snapshots and read again from the
+    start, so repeated snapshots cost no open() or close() calls. An
+    attribute which cannot be read is None in the snapshot."""
+    def __init__(self, sysfs_root=SYSFS_ROOT):
+        self._class_dir = os.path.join(sysfs_root, 'class', 'mic')
+        self._fds = {}
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        fds = getattr(self, '_fds', {})
+        self._fds = {}
+
+        for fd in fds.values():
+            os.close(fd)
+
+    def _read(self, path, previous_fds):
+        fd = previous_fds.pop(path, None)
+
+        if fd is not None:
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                data = os.read(fd, ATTR_SIZE)
+                self._fds[path] = fd
+                return data
+            except OSError:
+                # the device went away, try opening it again below
+                os.close(fd)
+
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+
+        try:
+            data = os.read(fd, ATTR_SIZE)
+        except OSError:
+            os.close(fd)
+            return None
+
+        self._fds[path] = fd
+        return data
+
+    def _read_attrs(self, directory, attrs, previous_fds):
+        values = []
+
+        for attr in attrs:
+            data = self._read(os.path.join(directory, attr), previous_fds)
+            values.append(data.rstrip(' \t\n\r') if data is not None else None)
+
+        return values
+
+    def snapshot(self):
+        previous_fds = self._fds
+        self._fds = {}
+
+        try:
+            entries = os.listdir(self._class_dir)
+        except OSError:
+            entries = []
+
+        devices = {}
+        for entry in entries:
+            match = MIC_DIR_RE.match(entry)
+
+            if match:
+                devices[int(match.group(1))] = MicRecord(*self._read_attrs(
+                    os.path.join(self._class_dir, entry), DEVICE_ATTRS,
+                    previous_fds))
+
+        driver = DriverRecord(*self._read_attrs(
+            os.path.join(self._class_dir, 'ctrl'), DRIVER_ATTRS, previous_fds))
+
+        # files left over belong to devices which are gone
+        for fd in previous_fds.values():
+            os.close(fd)
+
+        return Snapshot(driver, devices)
@@ -30,16 +30,27 @@
 # license agreement provided with this code and agreed upon with Intel,
 # no license, express or implied, by estoppel or otherwise, to any
 # intellectual property rights is granted herein.
-import subprocess
-import os
 import re
+import socket
 import _miccheck
-from _miccheck.common.micdevice import MicDevice
+from _miccheck.common.inventory import HostInventory
 from _miccheck.common import exceptions as ex
 from _miccheck.common import printing as prnt
-from _miccheck.common import tests as ctests
-
-SYSFS_VERSION = '/sys/class/mic/ctrl/version'
+from _miccheck.linux import icmp
+from _miccheck.linux import pci
+from _miccheck.linux import process
+from _miccheck.linux import procfs
+from _miccheck.linux import sysfs
+
+SYSFS_MIC_INITSTATE = '/sys/module/mic/initstate'
+LSPCI_PROGRAM = '/usr/bin/lspci'
+PING_PROGRAM = '/bin/ping'
+SSH_PROGRAM = '/usr/bin/ssh'
+PING_TIMEOUT = 3
+SSH_TIMEOUT = 3
+# seconds allowed to the ping and ssh programs on top of their own timeouts
+PROGRAM_GRACE = 5
+PING_RTT_RE = re.compile(r'time=([\d.]+) ms')
 
 def read_file(path):
     data = None
@@ -48,50 +59,35 @@ def read_file(path):
     return data.rstrip(' \t\n\r')
 
 
-def sysfs_device_read_attr(dev_num, attr):
-    return read_file('/sys/class/mic/mic%d/%s' % (dev_num, attr))
-
-
-def execute_program(command):
-    command_list = command.split()
-    ld_lib = None
-
-    if os.environ.get('LD_LIBRARY_PATH'):
-        ld_lib = os.environ['LD_LIBRARY_PATH']
-
-    # need to clear the LD_LIBRARY_PATH variable before trying to run an
-    # external program. this is because pyinstaller sets the LD_LIBRARY_PATH
-    # in the bootloader stage to a predefined location, and if by chance that
-    # location contains a library that the binary we want to execute needs, it will
-    # pick up that library, probably breaking things with the binary program
-    # quite badly.
-    os.environ['LD_LIBRARY_PATH'] = ''
-    popen = subprocess.Popen(command_list, shell=False, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
+def execute_program(command, timeout=process.DEFAULT_TIMEOUT):
+    result = process.run(command.split(), timeout)
 
-    if ld_lib:
-        os.environ['LD_LIBRARY_PATH'] = ld_lib
+    if result.error:
+        raise result.error
 
-    outputs = popen.communicate()
+    if result.timed_out:
+        raise ex.ExecProgramException('\'%s\' did not finish within %d '
+                                      'seconds' % (command, timeout))
 
-    if popen.returncode != 0:
+    if result.returncode != 0:
         raise ex.ExecProgramException('Failed to execute \'%s\': \'%s\'' %
-                                   (command, outputs[1].rstrip(' \t\n\r')))
-    return outputs[0].rstrip(' \t\n\r')
+                                   (command, result.stderr.rstrip(' \t\n\r')))
+    return result.stdout.rstrip(' \t\n\r')
 
 
-def num_mics_pci():
+def lspci_mics_pci():
     try:
         # "-d 8086:" will only display devices with 8086 as deviceid
         # -n prevents lspci to translate device ids to company names
         # -m enables machine readble output
-        output = execute_program('/usr/bin/lspci -d 8086: -n -m')
+        # -D shows the pci domain, like sysfs does
+        output = execute_program('%s -D -d 8086: -n -m' % LSPCI_PROGRAM)
     except OSError:
-        raise ex.ExecProgramException('/sbin/lspci could not be found in '
-                                      'the system')
+        raise ex.ExecProgramException('%s could not be found in the system'
+                                      % LSPCI_PROGRAM)
 
     # the output will be similar to:
-    # 84:00.0 "0b40" "8086" "2250" -r11 "8086" "2500"
+    # 0000:84:00.0 "0b40" "8086" "2250" -r11 "8086" "2500"
     # the device id will be always in the range 2250-225f
     mics = re.findall(r"""
         (.*)                                # anything at the beginning
@@ -99,68 +95,167 @@ def num_mics_pci():
         (\")(225[a-f0-9])(\")               # find device id in quotes
         (.*)                                # anything at the end
         """, output, re.X | re.MULTILINE | re.IGNORECASE)
-    return len(mics)
+    return [mic[0].split()[0] for mic in mics]
 
 
-def is_micdriver_loaded():
+def num_mics_driver():
+    # libmicmgmt is only loaded when the number of devices it sees is needed
+    from _miccheck.common.micdevice import MicDevice
+    return MicDevice.mic_get_ndevices()
+
+
+def mics_pci():
     try:
-        output = execute_program('/sbin/lsmod')
-    except OSError:
-        raise ex.ExecProgramException('/sbin/lsmod could not be found in '
-                                      'the system')
-    # the output will be similar to:
-    # mic                   596637  12
-    drivers = re.findall(r"""
-        ^mic\s+\d+\s+\d+     # should start with mic, followed by at least one
-                             # space, at least 1 digit, at least 1 space and
-                             # at least 1 digit.
-        """, output, re.X | re.MULTILINE)
+        return pci.sysfs_mics_pci()
+    except (IOError, OSError):
+        # sysfs is not mounted or not readable, fall back to pciutils
+        prnt.p_out_debug('PCI devices could not be read from sysfs, '
+                         'using lspci')
+        return lspci_mics_pci()
+
 
-    if len(drivers) > 1:
-        raise ex.FailedTestException('incorrect number of mic driver detected')
+def is_micdriver_loaded(proc):
+    try:
+        return proc.modules().get('mic') == 'Live'
+    except IOError:
+        pass
 
-    if len(drivers) == 0:
+    # /proc/modules may be hidden from restricted containers, while sysfs
+    # still tells whether the module finished loading
+    try:
+        return read_file(SYSFS_MIC_INITSTATE) == 'live'
+    except IOError:
         return False
 
-    return True
 
+def is_mpssd_running(proc):
+    return 'mpssd' in proc.processes().values()
+
+
+def ping_mics(devices):
+    names = ['mic%d' % device for device in devices]
 
-def is_mpssd_running():
     try:
-        execute_program('/bin/ps -Cmpssd')
-        return True
-    except OSError:
-        raise ex.ExecProgramException('/bin/ps could not be found in '
-                                      'the system')
-    except ex.ExecProgramException:
-        return False
+        return icmp.ping_hosts(names, PING_TIMEOUT)
+    except socket.error:
+        # icmp sockets are not permitted, run the ping program instead
+        pass
+
+    rtts = {}
+    results = process.run_many([[PING_PROGRAM, '-c1', '-w%d' % PING_TIMEOUT,
+                                 name] for name in names],
+                               PING_TIMEOUT + PROGRAM_GRACE)
+
+    for name, result in zip(names, results):
+        if result.error:
+            raise ex.ExecProgramException('%s could not be found in the '
+                                          'system' % PING_PROGRAM)
+
+        match = PING_RTT_RE.search(result.stdout)
+        if result.returncode == 0 and match:
+            rtts[name] = float(match.group(1)) / 1000
+        else:
+            rtts[name] = None
+
+    return rtts
+
+
+def ssh_mics(devices):
+    names = ['mic%d' % device for device in devices]
+    results = process.run_many([[SSH_PROGRAM,
+                                 '-oConnectTimeout=%d' % SSH_TIMEOUT,
+                                 '-oBatchMode=yes',
+                                 '-oStrictHostKeyChecking=no', name, 'echo',
+                                 'hello'] for name in names],
+                               SSH_TIMEOUT + PROGRAM_GRACE)
+    return dict(zip(names, results))
+
+
+def host_inventory():
+    inventory = HostInventory({
+        'mics_pci': mics_pci,
+        'num_mics_pci': lambda: len(inventory.get('mics_pci')),
+        'num_mics_driver': num_mics_driver,
+        'procfs': procfs.ProcFs,
+        'micdriver_loaded':
+            lambda: is_micdriver_loaded(inventory.get('procfs')),
+        'mpssd_running': lambda: is_mpssd_running(inventory.get('procfs')),
+        'boot_id': lambda: inventory.get('procfs').boot_id(),
+        'sysfs_reader': sysfs.SysfsReader,
+        # attributes of the driver and of every device, read in one pass
+        'sysfs': lambda: inventory.get('sysfs_reader').snapshot(),
+        # numbers of the devices tested, all those found over PCI unless
+        # the run set the ones it selected
+        'devices': lambda: range(inventory.get('num_mics_pci')),
+        # round trip times of the devices tested, pinged at once
+        'ping_rtts': lambda: ping_mics(inventory.get('devices')),
+        # results of ssh to the devices tested, run at once
+        'ssh_results': lambda: ssh_mics(inventory.get('devices'))},
+        persistent=('sysfs_reader',))
+    return inventory
+
+
+def device_sysfs_record(inventory, dev_num):
+    record = inventory.get('sysfs').devices.get(dev_num)
+
+    if record is None:
+        raise ex.FailedTestException('device mic%d not found in sysfs' %
+                                     dev_num)
+    return record
+
+
+def cache_identity(inventory, dev_num):
+    """Returns the state a cached result of a test on dev_num (-1 for the
+    host) depends on: the versions miccheck expects, the boot of the host,
+    the driver version and, for devices, the boot count and flash version
+    of the device. Flashing the card or its SMC takes effect with a reset
+    of the card, which the boot count tells apart even while the host stays
+    up; without it, results of the device are not cached."""
+    identity = [_miccheck.__version__, _miccheck.__smc_fw_version__,
+                inventory.get('boot_id'),
+                inventory.get('sysfs').driver.version]
+
+    if dev_num != -1:
+        record = device_sysfs_record(inventory, dev_num)
+
+        if record.boot_count is None:
+            raise ex.FailedTestException('boot count of device mic%d cannot '
+                                         'be read' % dev_num)
+        identity.extend([record.boot_count, record.flashversion])
+    return identity
 
 
 # test pci device detection
 class PciDevicesTest:
-    def __init__(self):
-        pass
+    watch_interval = 60
 
-    @staticmethod
-    def run():
-        if num_mics_pci() < 1:
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
+        if self._inventory.get('num_mics_pci') < 1:
             raise ex.FailedTestException('no Intel(R) Xeon Phi(TM) coprocessors'
                                          ' devices detected')
 
+        prnt.p_out_debug('    devices detected over PCI: %s' %
+                         ', '.join(self._inventory.get('mics_pci')))
+
     @staticmethod
     def msg_executing():
         return "Check number of devices the OS sees in the system"
 
 # test mic driver number of devices
 class ScifDevicesTest:
-    def __init__(self):
-        pass
+    watch_interval = 60
+    prerequisites = ('MicDriverTest',)
 
-    @staticmethod
-    def run():
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
         try:
-            num_dev_pci = num_mics_pci()
-            num_dev_scif = MicDevice.mic_get_ndevices()
+            num_dev_pci = self._inventory.get('num_mics_pci')
+            num_dev_scif = self._inventory.get('num_mics_driver')
 
             if num_dev_scif != num_dev_pci:
                 raise ex.FailedTestException('SCIF nodes do not match number'
@@ -176,12 +271,13 @@ class ScifDevicesTest:
 
 # test mic driver detection
 class MicDriverTest:
-    def __init__(self):
-        pass
+    watch_interval = 30
 
-    @staticmethod
-    def run():
-        if not is_micdriver_loaded():
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
+        if not self._inventory.get('micdriver_loaded'):
             raise ex.FailedTestException('mic driver not loaded')
 
     @staticmethod
@@ -191,9 +287,14 @@ class MicDriverTest:
 
 # test mpssd daemon running
 class MpssRunTest:
-    @staticmethod
-    def run():
-        if not is_mpssd_running():
+    watch_interval = 30
+    prerequisites = ('MicDriverTest',)
+
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
+        if not self._inventory.get('mpssd_running'):
             raise ex.FailedTestException('mpssd daemon not running')
 
     @staticmethod
@@ -203,10 +304,19 @@ class MpssRunTest:
 
 # tests the driver version is correct
 class DriverVersionTest:
-    @staticmethod
-    def run():
+    watch_interval = 3600
+    cacheable = True
+    prerequisites = ('MicDriverTest',)
+
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
         miccheck_version = _miccheck.__version__
-        driver_version = read_file(SYSFS_VERSION)
+        driver_version = self._inventory.get('sysfs').driver.version
+
+        if driver_version is None:
+            raise ex.FailedTestException('driver version could not be read')
 
         driver_is_eng = True
         miccheck_is_eng = True
@@ -251,15 +361,20 @@ class DriverVersionTest:
 
 # test device in online mode and postcode FF
 class StateTest:
-    def __init__(self, dev_num):
+    watch_interval = 5
+    prerequisites = ('MicDriverTest',)
+
+    def __init__(self, dev_num, inventory):
         self._dev_num = dev_num
+        self._inventory = inventory
 
     def run(self): # not static, because it is a device test
-        try:
-            state = sysfs_device_read_attr(self._dev_num, 'state')
-            postcode = sysfs_device_read_attr(self._dev_num, 'post_code')
-        except Exception, excp:
-            raise ex.FailedTestException(str(excp))
+        record = device_sysfs_record(self._inventory, self._dev_num)
+        state = record.state
+        postcode = record.post_code
+
+        if state is None or postcode is None:
+            raise ex.FailedTestException('device state could not be read')
 
         if state != 'online':
             raise ex.FailedTestException('device is not online: ' + state)
@@ -274,11 +389,15 @@ class StateTest:
 
 # test device has RAS daemon available
 class RasTest:
-    def __init__(self, dev_num):
+    watch_interval = 30
+    prerequisites = ('StateTest',)
+
+    def __init__(self, dev_num, device_pool):
         self._dev_num = dev_num
+        self._device_pool = device_pool
 
     def run(self): # not static because it is a device test
-        device = MicDevice(self._dev_num)
+        device = self._device_pool.get(self._dev_num)
 
         if not device.mic_is_ras_avail():
             raise ex.FailedTestException('ras daemon is not available')
@@ -290,11 +409,17 @@ class RasTest:
 
 # check the flash version of the device
 class FlashVersionTest:
-    def __init__(self, dev_num):
+    watch_interval = 3600
+    cacheable = True
+    prerequisites = ('StateTest',)
+
+    def __init__(self, dev_num, device_pool, inventory):
         self._dev_num = dev_num
+        self._device_pool = device_pool
+        self._inventory = inventory
 
     def run(self): # not static because it is a device test
-        device = MicDevice(self._dev_num)
+        device = self._device_pool.get(self._dev_num)
 
         built_flashver = _miccheck.__flash_version__
 
@@ -303,7 +428,12 @@ class FlashVersionTest:
         if built_flashver.find('-') != -1:
             built_flashver = built_flashver[0:built_flashver.find('-')]
 
-        curr_flashver = sysfs_device_read_attr(self._dev_num, 'flashversion')
+        curr_flashver = device_sysfs_record(self._inventory,
+                                            self._dev_num).flashversion
+
+        if curr_flashver is None:
+            raise ex.FailedTestException('device flash version could not be '
+                                         'read')
 
         if built_flashver != curr_flashver:
             pass
@@ -321,21 +451,22 @@ class FlashVersionTest:
 
 # test device can be pinged
 class PingTest:
-    def __init__(self, dev_num):
+    watch_interval = 30
+    prerequisites = ('StateTest',)
+
+    def __init__(self, dev_num, inventory):
         self._dev_num = dev_num
         self._dev_name = "mic%d" % self._dev_num
+        self._inventory = inventory
 
     def run(self): # not static because it is a device test
-        try:
-            timeout = 3
-            output = execute_program('/bin/ping -c1 -w%d %s' % (timeout, self._dev_name))
-        except OSError:
-            raise ex.ExecProgramException('/bin/ping could not be found in '
-                                          'the system')
-        except ex.ExecProgramException, excp:
+        rtt = self._inventory.get('ping_rtts').get(self._dev_name)
+        if rtt is None:
             raise ex.FailedTestException('interface %s did not respond to '
                                          'ping request' % self._dev_name)
 
+        prnt.p_out_debug('    round trip time: %.3f ms' % (rtt * 1000))
+
     @staticmethod
     def msg_executing():
         return "Check device can be pinged over its network interface"
@@ -343,109 +474,25 @@ class PingTest:
 
 # test device can be accessed through ssh
 class SshTest:
-    def __init__(self, dev_num):
+    watch_interval = 60
+    prerequisites = ('StateTest', 'PingTest')
+
+    def __init__(self, dev_num, inventory):
         self._dev_num = dev_num
         self._dev_name = "mic%d" % self._dev_num
+        self._inventory = inventory
 
     def run(self): # not static because it is a device test
-        try:
-            timeout = 3
-            exec_line = ('/usr/bin/ssh -oConnectTimeout=%d -oBatchMode=yes '
-                        '-oStrictHostKeyChecking=no %s echo hello' %
-                        (timeout, self._dev_name))
-            output = execute_program(exec_line)
-        except OSError:
-            raise ex.ExecProgramException('/usr/bin/ssh could not be found in '
-                                          'the system')
-        except ex.ExecProgramException, excp:
+        result = self._inventory.get('ssh_results').get(self._dev_name)
+
+        if result is not None and result.error:
+            raise ex.ExecProgramException('%s could not be found in the '
+                                          'system' % SSH_PROGRAM)
+
+        if result is None or result.returncode != 0:
             raise ex.FailedTestException('interface %s could not be accessed '
                                          'through ssh' % self._dev_name)
 
     @staticmethod
     def msg_executing():
         return "Check device can be accessed through ssh"
-
-
-def default_host_tests(runner, settings):
-    prnt.p_out('Executing default tests for host')
-
-    if settings.pci_devices:
-        # make sure we have devices attached to the host
-        runner.run(PciDevicesTest())
-
-    if settings.driver_loaded:
-        # make sure mic driver is loaded
-        runner.run(MicDriverTest())
-
-    if settings.driver_devices:
-        # make sure driver detected the same num of devices as the
-        # pci buses did
-        runner.run(ScifDevicesTest())
-
-    if settings.mpssd_loaded:
-        # make sure mpss daemon is running
-        runner.run(MpssRunTest())
-
-
-def optional_host_tests(runner, settings):
-    if settings.driver_ver:
-        prnt.p_out('Executing optional tests for host')
-
-    if settings.driver_ver:
-        # check the loaded driver version
-        runner.run(DriverVersionTest())
-
-
-def default_device_tests(runner, devices, settings):
-    device_failed = False
-
-    for device in devices:
-        try:
-            prnt.p_out('Executing default tests for device: %d' % device)
-
-            if settings.dev_state:
-                # make sure the device is online with postcode FF
-                runner.run(StateTest(device), device)
-
-            if settings.dev_rasdaemon:
-                # make sure ras daemon is running on device
-                runner.run(RasTest(device), device)
-
-            if settings.flash_ver:
-                # make sure flash version is correct
-                runner.run(FlashVersionTest(device), device)
-
-            if settings.smc_ver:
-                # make sure smc fw version is correct
-                runner.run(ctests.SmcFirmwareTest(device), device)
-
-        # MicDevice objects can throw RuntimeError and cause premature termination
-        except (ex.FailedTestException, RuntimeError):
-            # so we continue testing other devices if present
-            device_failed = True
-
-    if device_failed:
-        raise ex.FailedTestException('A device test failed')
-
-
-def optional_device_tests(runner, devices, settings):
-    device_failed = False
-
-    for device in devices:
-        try:
-            if settings.ping or settings.ssh:
-                prnt.p_out('Executing optional tests for device: %d' % device)
-
-            if settings.ping:
-                runner.run(PingTest(device), device)
-
-            if settings.ssh:
-                runner.run(SshTest(device), device)
-
-        # MicDevice objects can throw RuntimeError and cause premature termination
-        except (ex.FailedTestException, RuntimeError):
-            # so we continue testing other devices if present
-            device_failed = True
-
-    if device_failed:
-        raise ex.FailedTestException('An optional device test failed')
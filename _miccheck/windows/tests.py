@@ -35,10 +35,9 @@ import pywintypes
 import re
 import _miccheck
 from _miccheck.common import exceptions as ex
-from _miccheck.common.micdevice import MicDevice
+from _miccheck.common.inventory import HostInventory
 from _miccheck.common import printing as prnt
 from distutils.version import LooseVersion
-from _miccheck.common import tests as ctests
 
 def num_mics_pci():
     matches = 0
@@ -69,14 +68,20 @@ def wmi_get_driver_version():
     return wmi[0].driver_version
 
 
+def host_inventory():
+    return HostInventory({'num_mics_pci': num_mics_pci,
+                          'num_mics_driver': num_mics_wmi})
+
+
 # test pci device detection
 class PciDevicesTest:
-    def __init__(self):
-        pass
+    watch_interval = 60
 
-    @staticmethod
-    def run():
-        devices = num_mics_pci()
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
+        devices = self._inventory.get('num_mics_pci')
 
         if devices < 1:
             raise ex.FailedTestException('no MIC devices detected')
@@ -87,14 +92,16 @@ class PciDevicesTest:
 
 # compare pci num devices with wmi num devices
 class WmiDevicesTest:
-    def __init__(self):
-        pass
+    watch_interval = 60
+    prerequisites = ('MicDriverTest',)
 
-    @staticmethod
-    def run():
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
         try:
-            num_dev_pci = num_mics_pci()
-            num_dev_wmi = num_mics_wmi()
+            num_dev_pci = self._inventory.get('num_mics_pci')
+            num_dev_wmi = self._inventory.get('num_mics_driver')
 
             if num_dev_wmi != num_dev_pci:
                 raise ex.FailedTestException('WMI num devices does not match '
@@ -110,12 +117,13 @@ class WmiDevicesTest:
 
 # test mic driver detection
 class MicDriverTest:
-    def __init__(self):
-        pass
+    watch_interval = 30
 
-    @staticmethod
-    def run():
-        num_devices = num_mics_wmi()
+    def __init__(self, inventory):
+        self._inventory = inventory
+
+    def run(self):
+        num_devices = self._inventory.get('num_mics_driver')
 
         if num_devices < 1:
             raise ex.FailedTestException('mic driver not loaded')
@@ -134,6 +142,9 @@ def ltrim_version(string, num_dots):
 # e.g. a=3.2.40, b=3.2.50 is acceptable, a=3.1.40, b=3.2.50
 # is not.
 class DriverVersionTest:
+    watch_interval = 3600
+    prerequisites = ('MicDriverTest',)
+
     @staticmethod
     def run():
         build_version = _miccheck.__version__ # b
@@ -163,6 +174,9 @@ class DriverVersionTest:
 
 # test device in online mode and postcode FF
 class StateTest:
+    watch_interval = 5
+    prerequisites = ('MicDriverTest',)
+
     def __init__(self, dev_num):
         self._dev_num = dev_num
 
@@ -185,11 +199,15 @@ class StateTest:
 
 # test device has RAS daemon available
 class RasTest:
-    def __init__(self, dev_num):
+    watch_interval = 30
+    prerequisites = ('StateTest',)
+
+    def __init__(self, dev_num, device_pool):
         self._dev_num = dev_num
+        self._device_pool = device_pool
 
     def run(self): # not static because it is a device test
-        device = MicDevice(self._dev_num)
+        device = self._device_pool.get(self._dev_num)
 
         if not device.mic_is_ras_avail():
             raise ex.FailedTestException('ras daemon is not available')
@@ -197,61 +215,3 @@ class RasTest:
     @staticmethod
     def msg_executing():
         return "Check ras daemon is available in device"
-
-
-def default_host_tests(runner, settings):
-    prnt.p_out('Executing default tests for host')
-
-    if settings.pci_devices:
-        # make sure we have devices attached to the host
-        runner.run(PciDevicesTest())
-
-    if settings.driver_loaded:
-        # make sure mic driver is loaded
-        runner.run(MicDriverTest())
-
-    if settings.driver_devices:
-        # make sure driver detected the same num of devices as the
-        # pci buses did
-        runner.run(WmiDevicesTest())
-
-
-def optional_host_tests(runner, settings):
-    if settings.driver_ver:
-        prnt.p_out('Executing optional tests for host')
-
-    if settings.driver_ver:
-        # check the loaded driver version
-        runner.run(DriverVersionTest())
-
-
-def default_device_tests(runner, devices, settings):
-    device_failed = False
-
-    for device in devices:
-        try:
-            prnt.p_out('Executing default tests for device: %d' % device)
-
-            if settings.dev_state:
-                # make sure the device is online with postcode FF
-                runner.run(StateTest(device), device)
-
-            if settings.dev_rasdaemon:
-                # make sure ras daemon is running on device
-                runner.run(RasTest(device), device)
-
-            if settings.smc_ver:
-                # make sure smc fw version is correct
-                runner.run(ctests.SmcFirmwareTest(device), device)
-
-        except (ex.FailedTestException, RuntimeError):
-            # so we continue testing other devices if present
-            device_failed = True
-
-    if device_failed:
-        raise ex.FailedTestException('A device test failed')
-
-
-def optional_device_tests(runner, devices, settings):
-    pass
-
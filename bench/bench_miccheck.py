@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+"""Runs miccheck end to end against simulated hosts (see simhw.py) with 1 to
+64 cards, in each execution mode, and reports the run times and the time
+of each test.
+
+Example, 64 cards with a slow libmicmgmt and two cards offline:
+    bench_miccheck.py -c 64 --latency mic_open_device=0.002 \\
+        --fail state:3,7
+
+Example, 16 cards of which one wedges in libmicmgmt and one crashes it:
+    bench_miccheck.py -c 16 -t 1 --fail hang:2 --fail crash:5"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+import simhw
+from _miccheck.common import main as miccheck
+from _miccheck.common import printing as prnt
+from _miccheck.common import testrunner
+from _miccheck.common.testrunner import TestRunner
+
+# miccheck arguments of each mode, cached runs reuse the results of a
+# warm-up run
+MODES = {
+    'serial': ['--no-cache'],
+    'parallel': ['--no-cache', '--jobs={cards}'],
+    'cached': ['--cache-file={cache}'],
+}
+MODE_ORDER = ('serial', 'parallel', 'cached')
+OPTIONAL_TESTS = ['--driver_ver', '--ping', '--ssh']
+
+
+class RecordingTestRunner(TestRunner):
+    """Keeps the last runner created by miccheck, for its results"""
+    last = None
+
+    def __init__(self, *args, **kwargs):
+        TestRunner.__init__(self, *args, **kwargs)
+        RecordingTestRunner.last = self
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_miccheck(args):
+    sys.argv = ['miccheck'] + args
+    prnt.set_out_stream(open(os.devnull, 'w'))
+    start = time.time()
+
+    try:
+        status = miccheck.main()
+    finally:
+        prnt.set_out_stream(sys.stdout)
+
+    return status, time.time() - start, RecordingTestRunner.last.results
+
+
+def bench_mode(host, mode, runs, extra_args):
+    args = [arg.format(cards=host.cards,
+                       cache=os.path.join(host.root, 'cache.json'))
+            for arg in MODES[mode]] + extra_args
+    # outcomes of the simulated runs must not replace those of the host,
+    # nor end up in its history
+    args.append('--last-run-file=%s' % os.path.join(host.root,
+                                                    'last_run.json'))
+    args.append('--history-file=%s' % os.path.join(host.root, 'history'))
+
+    if mode == 'cached':
+        run_miccheck(args)
+
+    durations = []
+    test_times = {}
+    failed_runs = 0
+
+    for _ in range(runs):
+        status, duration, results = run_miccheck(args)
+        durations.append(duration)
+        failed_runs += status != 0
+
+        for result in results:
+            test_times.setdefault(result.test, []).append(result.wall_time)
+
+    return durations, test_times, failed_runs
+
+
+def report(cards, mode, durations, test_times, failed_runs):
+    print('{0:>5} {1:<9} {2:>5} {3:>6} {4:>9.2f} {5:>9.2f} {6:>9.2f} '
+          '{7:>9.2f}'.format(cards, mode, len(durations), failed_runs,
+                             min(durations) * 1e3,
+                             percentile(durations, 0.5) * 1e3,
+                             percentile(durations, 0.95) * 1e3,
+                             max(durations) * 1e3))
+
+    for test, times in sorted(test_times.items(),
+                              key=lambda item: -sum(item[1])):
+        print('      {0:<26} {1:>6} {2:>9.3f} {3:>9.3f} {4:>9.3f}'.format(
+            test, len(times), percentile(times, 0.5) * 1e3,
+            percentile(times, 0.95) * 1e3, max(times) * 1e3))
+
+
+def parse_cards(arg):
+    return set(int(card) for card in arg.split(',')) if arg else None
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]\n\n' +
+                          __doc__.split('\n\n')[0])
+    parser.add_option("-c", "--cards", dest="cards", default='1,4,16,64',
+                      help="comma separated numbers of simulated cards "
+                           "[default=%default]")
+    parser.add_option("-m", "--modes", dest="modes",
+                      default=','.join(MODE_ORDER),
+                      help="comma separated execution modes "
+                           "[default=%default]")
+    parser.add_option("-r", "--runs", dest="runs", type="int", default=10,
+                      help="timed runs per mode [default=%default]")
+    parser.add_option("-o", "--optional", dest="optional",
+                      action="store_true", default=False,
+                      help="also run the optional tests: %s" %
+                           ' '.join(OPTIONAL_TESTS))
+    parser.add_option("-l", "--latency", dest="latencies", action="append",
+                      default=[], metavar="PROBE=SECONDS",
+                      help="slow down a stub program or libmicmgmt function")
+    parser.add_option("-f", "--fail", dest="failures", action="append",
+                      default=[], metavar="PROBE[:CARD,...]",
+                      help="make a probe fail, on all cards unless some "
+                           "are given")
+    parser.add_option("-t", "--device-timeout", dest="device_timeout",
+                      type="int", metavar="SECONDS",
+                      help="seconds miccheck waits for a libmicmgmt call "
+                           "before killing the worker of its card")
+    (options, args) = parser.parse_args()
+
+    modes = options.modes.split(',')
+    for mode in modes:
+        if mode not in MODES:
+            parser.error('unknown mode %s' % mode)
+
+    try:
+        cards_list = [int(cards) for cards in options.cards.split(',')]
+        latencies = dict((name, float(seconds)) for name, _, seconds in
+                         (latency.partition('=')
+                          for latency in options.latencies))
+        failures = dict((name, parse_cards(cards)) for name, _, cards in
+                        (failure.partition(':')
+                         for failure in options.failures))
+    except ValueError, excp:
+        parser.error(str(excp))
+
+    extra_args = OPTIONAL_TESTS if options.optional else []
+    if options.device_timeout is not None:
+        extra_args = extra_args + ['--device-timeout=%d' %
+                                   options.device_timeout]
+    testrunner.TestRunner = RecordingTestRunner
+
+    print('{0:>5} {1:<9} {2:>5} {3:>6} {4:>9} {5:>9} {6:>9} {7:>9}'.format(
+        'cards', 'mode', 'runs', 'failed', 'min ms', 'median', 'p95', 'max'))
+    print('      {0:<26} {1:>6} {2:>9} {3:>9} {4:>9}'.format(
+        'test', 'runs', 'median ms', 'p95', 'max'))
+
+    for cards in cards_list:
+        host = simhw.SimulatedHost(cards, latencies, failures)
+
+        try:
+            host.install()
+
+            for mode in modes:
+                report(cards, mode, *bench_mode(host, mode, options.runs,
+                                                extra_args))
+        finally:
+            host.remove()
+
+    return 0
+
+if __name__ == "__main__":
+    STATUS = main()
+    sys.exit(STATUS)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+"""Measures the per-call overhead of libmicmgmt calls, with and without the
+prototypes declared by _miccheck.common.libmicmgmt."""
+import ctypes
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from _miccheck.common import libmicmgmt
+from _miccheck.common.micdevice import MicDevice
+
+
+def report(name, seconds, calls):
+    print('{0:<40} {1:>10.0f} ns/call'.format(name, seconds * 1e9 / calls))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-d", "--device", dest="device", type="int", default=0,
+                      help="device to open [default=%default]")
+    parser.add_option("-n", "--calls", dest="calls", type="int",
+                      default=100000,
+                      help="calls per measurement [default=%default]")
+    (options, args) = parser.parse_args()
+
+    device = MicDevice(options.device)
+    enabled = ctypes.c_int()
+    p_enabled = ctypes.byref(enabled)
+
+    counted = libmicmgmt.library().mic_is_ras_avail
+    typed = libmicmgmt.load(libmicmgmt.MICMGMT_LIBRARY).mic_is_ras_avail
+    # a second instance of the library has no prototypes declared, so its
+    # calls go through the default conversion of the arguments
+    untyped = ctypes.CDLL(libmicmgmt.MICMGMT_LIBRARY).mic_is_ras_avail
+
+    report('mic_is_ras_avail (counted, prototype)',
+           timeit.timeit(lambda: counted(device.mdh, p_enabled),
+                         number=options.calls), options.calls)
+    report('mic_is_ras_avail (prototype)',
+           timeit.timeit(lambda: typed(device.mdh, p_enabled),
+                         number=options.calls), options.calls)
+    report('mic_is_ras_avail (no prototype)',
+           timeit.timeit(lambda: untyped(device.mdh, p_enabled),
+                         number=options.calls), options.calls)
+    report('MicDevice.mic_is_ras_avail',
+           timeit.timeit(device.mic_is_ras_avail, number=options.calls),
+           options.calls)
+    # one telemetry sample is twelve calls, see MicDevice.mic_get_telemetry
+    report('MicDevice.mic_get_telemetry',
+           timeit.timeit(device.mic_get_telemetry, number=options.calls),
+           options.calls)
+
+    device.close()
+    return 0
+
+if __name__ == "__main__":
+    STATUS = main()
+    sys.exit(STATUS)
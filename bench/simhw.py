@@ -0,0 +1,384 @@
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+"""A simulated host with Intel(R) Xeon Phi(TM) coprocessors, for running
+miccheck without the hardware: a sysfs and a procfs tree in a temporary
+directory, stub lspci, ping and ssh programs, and a Python stand-in for
+libmicmgmt.
+
+Probes can be slowed down and made to fail. Latencies apply to the stub
+programs (lspci, ping, ssh) and to every libmicmgmt function by name;
+files are served from the file system, so their latency is the real one.
+Failures are given for all the cards or for some of them, and can be:
+    lspci, ping, ssh        the program exits with 1
+    pci_sysfs               sysfs has no PCI devices, so lspci is used
+    state, post_code        the card is offline, or stuck in POST
+    flashversion            the card's attribute is missing
+    mic_module, mpssd       the driver is not loaded, mpssd is not running
+    mic_*                   the libmicmgmt function returns an error
+    hang, crash             the libmicmgmt functions of the card, opening it
+                            aside, never return, or crash the process
+    thermal_throttle,       the card reports being throttled
+    power_throttle"""
+import functools
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+import _miccheck
+from _miccheck.common import libmicmgmt
+from _miccheck.linux import icmp
+from _miccheck.linux import pci
+from _miccheck.linux import procfs
+from _miccheck.linux import sysfs
+from _miccheck.linux import tests
+
+FLASH_VERSION = '2.1.02.0391'
+SMC_FW_VERSION = '1.17.6900'
+MIC_DEVICE_ID = 0x2250
+MPSSD_PID = 2000
+E_MIC_FAILED = 1
+PROGRAMS = ('lspci', 'ping', 'ssh')
+# telemetry of the simulated cards, the die temperature rising by one degree
+# per card up to 15 degrees more
+DIE_TEMP = 55
+FAN_RPM = 2700
+FAN_PWM = 50
+POWER_UW = 115 * 1000 * 1000
+
+_ORIGINAL = {
+    'SysfsReader': sysfs.SysfsReader,
+    'ProcFs': procfs.ProcFs,
+    'sysfs_mics_pci': pci.sysfs_mics_pci,
+}
+
+
+def bdf(card):
+    return '0000:%02x:00.0' % (card + 1)
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with open(path, 'w') as attr:
+        attr.write(data)
+
+
+def _value(arg):
+    # handles arrive as c_void_p, numbers as c_uint32
+    return getattr(arg, 'value', arg)
+
+
+def _store(pointer, value):
+    # pointers arrive as the result of ctypes.byref()
+    pointer._obj.value = value
+
+
+class SimulatedHost:
+    """cards is the number of simulated cards; latencies maps a probe name
+    to the seconds it takes, failures maps a probe name to the cards on
+    which it fails, None meaning all of them"""
+    def __init__(self, cards, latencies=None, failures=None):
+        self.cards = cards
+        self.latencies = latencies or {}
+        self.failures = failures or {}
+        self.root = tempfile.mkdtemp(prefix='miccheck-sim-')
+        self.sysfs_root = os.path.join(self.root, 'sys')
+        self.proc_root = os.path.join(self.root, 'proc')
+        self.bin_dir = os.path.join(self.root, 'bin')
+        self._build_sysfs()
+        self._build_procfs()
+        self._build_programs()
+
+    def fails(self, probe, card=None):
+        if probe not in self.failures:
+            return False
+
+        cards = self.failures[probe]
+        return cards is None or card is None or card in cards
+
+    def _failing_cards(self, probe):
+        return [card for card in range(self.cards) if self.fails(probe, card)]
+
+    def _build_sysfs(self):
+        if not self.fails('pci_sysfs'):
+            devices_dir = os.path.join(self.sysfs_root, 'bus', 'pci',
+                                       'devices')
+            # a host bridge, which every real host has
+            _write(os.path.join(devices_dir, '0000:00:00.0', 'vendor'),
+                   '0x8086\n')
+            _write(os.path.join(devices_dir, '0000:00:00.0', 'device'),
+                   '0x0e00\n')
+
+            for card in range(self.cards):
+                _write(os.path.join(devices_dir, bdf(card), 'vendor'),
+                       '0x8086\n')
+                _write(os.path.join(devices_dir, bdf(card), 'device'),
+                       '0x%04x\n' % MIC_DEVICE_ID)
+
+        class_dir = os.path.join(self.sysfs_root, 'class', 'mic')
+        _write(os.path.join(class_dir, 'ctrl', 'version'),
+               _miccheck.__version__ + '\n')
+
+        for card in range(self.cards):
+            card_dir = os.path.join(class_dir, 'mic%d' % card)
+            _write(os.path.join(card_dir, 'state'),
+                   'offline\n' if self.fails('state', card) else 'online\n')
+            _write(os.path.join(card_dir, 'post_code'),
+                   '3C\n' if self.fails('post_code', card) else 'FF\n')
+            _write(os.path.join(card_dir, 'boot_count'), '1\n')
+
+            if not self.fails('flashversion', card):
+                _write(os.path.join(card_dir, 'flashversion'),
+                       FLASH_VERSION + '\n')
+
+        _write(os.path.join(self.sysfs_root, 'module', 'mic', 'initstate'),
+               'coming\n' if self.fails('mic_module') else 'live\n')
+
+    def _build_procfs(self):
+        modules = 'ext4 574084 1 - Live 0xffffffffa0002000\n'
+
+        if not self.fails('mic_module'):
+            modules += 'mic 596637 12 - Live 0xffffffffa0363000\n'
+        _write(os.path.join(self.proc_root, 'modules'), modules)
+        _write(os.path.join(self.proc_root, '1', 'comm'), 'init\n')
+
+        if not self.fails('mpssd'):
+            _write(os.path.join(self.proc_root, str(MPSSD_PID), 'comm'),
+                   'mpssd\n')
+        _write(os.path.join(self.proc_root, 'sys', 'kernel', 'random',
+                            'boot_id'), 'simulated-%d\n' % self.cards)
+
+    def _build_programs(self):
+        lspci_output = ''.join('%s "0b40" "8086" "%04x" -r11 "8086" "2500"\\n'
+                               % (bdf(card), MIC_DEVICE_ID)
+                               for card in range(self.cards))
+        outputs = {
+            'lspci': 'printf \'%s\'' % lspci_output,
+            'ping': 'echo "64 bytes from $host: icmp_seq=1 ttl=64 '
+                    'time=0.105 ms"',
+            'ssh': 'echo hello',
+        }
+
+        for program in PROGRAMS:
+            failing = ['mic%d' % card
+                       for card in self._failing_cards(program)]
+            script = ['#!/bin/sh']
+
+            if self.latencies.get(program):
+                script.append('sleep %f' % self.latencies[program])
+
+            # the card is the first argument which names one
+            script.append('host=')
+            script.append('for arg; do case "$arg" in mic*) host=$arg; '
+                          'break;; esac; done')
+
+            if self.fails(program) and program == 'lspci':
+                script.append('exit 1')
+            elif failing:
+                script.append('case "$host" in %s) exit 1;; esac' %
+                              '|'.join(failing))
+
+            script.append(outputs[program])
+            path = os.path.join(self.bin_dir, program)
+            _write(path, '\n'.join(script) + '\n')
+            os.chmod(path, 0755)
+
+    def install(self):
+        """Points miccheck at the simulated host, for the rest of the
+        process or until another host is installed"""
+        sysfs.SysfsReader = functools.partial(_ORIGINAL['SysfsReader'],
+                                              self.sysfs_root)
+        procfs.ProcFs = functools.partial(_ORIGINAL['ProcFs'],
+                                          self.proc_root)
+        pci.sysfs_mics_pci = functools.partial(_ORIGINAL['sysfs_mics_pci'],
+                                               self.sysfs_root)
+        tests.SYSFS_MIC_INITSTATE = os.path.join(self.sysfs_root, 'module',
+                                                 'mic', 'initstate')
+        tests.LSPCI_PROGRAM = os.path.join(self.bin_dir, 'lspci')
+        tests.PING_PROGRAM = os.path.join(self.bin_dir, 'ping')
+        tests.SSH_PROGRAM = os.path.join(self.bin_dir, 'ssh')
+        # the simulated cards have no network interface to send icmp to,
+        # so ping behaves as in a host where icmp sockets are not permitted
+        icmp.ping_hosts = _no_icmp
+        libmicmgmt._library = libmicmgmt.Library(SimulatedLibrary(self))
+        _miccheck.__flash_version__ = FLASH_VERSION
+        _miccheck.__smc_fw_version__ = SMC_FW_VERSION
+
+    def remove(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _no_icmp(hosts, timeout):
+    raise socket.error('icmp is not simulated')
+
+
+class SimulatedLibrary:
+    """Stands in for the functions of libmicmgmt used by miccheck. The
+    handle of a card, and of its thermal information, is its number plus
+    one, so no handle is NULL"""
+    def __init__(self, host):
+        self._host = host
+
+    def _probe(self, function, card=None):
+        latency = self._host.latencies.get(function)
+
+        if latency:
+            time.sleep(latency)
+
+        if card is not None and function != 'mic_open_device':
+            if self._host.fails('crash', card):
+                os.kill(os.getpid(), signal.SIGSEGV)
+            while self._host.fails('hang', card):
+                time.sleep(60)
+        return self._host.fails(function, card)
+
+    def mic_get_devices(self, p_devices):
+        if self._probe('mic_get_devices'):
+            return E_MIC_FAILED
+        _store(p_devices, 1)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_ndevices(self, devices, p_count):
+        if self._probe('mic_get_ndevices'):
+            return E_MIC_FAILED
+        _store(p_count, self._host.cards)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_free_devices(self, devices):
+        if self._probe('mic_free_devices'):
+            return E_MIC_FAILED
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_open_device(self, p_device, dev_num):
+        card = _value(dev_num)
+
+        if self._probe('mic_open_device', card) or card >= self._host.cards:
+            return E_MIC_FAILED
+        _store(p_device, card + 1)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_close_device(self, device):
+        if self._probe('mic_close_device', _value(device) - 1):
+            return E_MIC_FAILED
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_is_ras_avail(self, device, p_enabled):
+        if self._probe('mic_is_ras_avail', _value(device) - 1):
+            _store(p_enabled, 0)
+            return E_MIC_FAILED
+        _store(p_enabled, 1)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_thermal_info(self, device, p_thermal):
+        if self._probe('mic_get_thermal_info', _value(device) - 1):
+            return E_MIC_FAILED
+        _store(p_thermal, _value(device))
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_smc_fwversion(self, thermal, version, p_size):
+        if self._probe('mic_get_smc_fwversion', _value(thermal) - 1):
+            return E_MIC_FAILED
+        version.value = SMC_FW_VERSION
+        _store(p_size, len(SMC_FW_VERSION) + 1)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_die_temp(self, thermal, p_temp):
+        card = _value(thermal) - 1
+        if self._probe('mic_get_die_temp', card):
+            return E_MIC_FAILED
+        _store(p_temp, DIE_TEMP + card % 16)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_fan_rpm(self, thermal, p_rpm):
+        if self._probe('mic_get_fan_rpm', _value(thermal) - 1):
+            return E_MIC_FAILED
+        _store(p_rpm, FAN_RPM)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_fan_pwm(self, thermal, p_pwm):
+        if self._probe('mic_get_fan_pwm', _value(thermal) - 1):
+            return E_MIC_FAILED
+        _store(p_pwm, FAN_PWM)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_power_utilization_info(self, device, p_power):
+        if self._probe('mic_get_power_utilization_info', _value(device) - 1):
+            return E_MIC_FAILED
+        _store(p_power, _value(device))
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_total_power_readings_w0(self, power, p_uw):
+        if self._probe('mic_get_total_power_readings_w0', _value(power) - 1):
+            return E_MIC_FAILED
+        _store(p_uw, POWER_UW)
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_free_power_utilization_info(self, power):
+        if self._probe('mic_free_power_utilization_info', _value(power) - 1):
+            return E_MIC_FAILED
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_throttle_state_info(self, device, p_throttle):
+        if self._probe('mic_get_throttle_state_info', _value(device) - 1):
+            return E_MIC_FAILED
+        _store(p_throttle, _value(device))
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_thermal_ttl_active(self, throttle, p_active):
+        card = _value(throttle) - 1
+        if self._probe('mic_get_thermal_ttl_active', card):
+            return E_MIC_FAILED
+        _store(p_active, int(self._host.fails('thermal_throttle', card)))
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_get_power_ttl_active(self, throttle, p_active):
+        card = _value(throttle) - 1
+        if self._probe('mic_get_power_ttl_active', card):
+            return E_MIC_FAILED
+        _store(p_active, int(self._host.fails('power_throttle', card)))
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_free_throttle_state_info(self, throttle):
+        if self._probe('mic_free_throttle_state_info', _value(throttle) - 1):
+            return E_MIC_FAILED
+        return libmicmgmt.E_MIC_SUCCESS
+
+    def mic_free_thermal_info(self, thermal):
+        if self._probe('mic_free_thermal_info', _value(thermal) - 1):
+            return E_MIC_FAILED
+        return libmicmgmt.E_MIC_SUCCESS
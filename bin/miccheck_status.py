@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# Copyright 2010-2013 Intel Corporation.
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, version 2.1.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# Lesser General Public License for more details.
+#
+# Disclaimer: The codes contained in these modules may be specific
+# to the Intel Software Development Platform codenamed Knights Ferry,
+# and the Intel product codenamed Knights Corner, and are not backward
+# compatible with other Intel products. Additionally, Intel will NOT
+# support the codes or instruction set in future products.
+#
+# Intel offers no warranty of any kind regarding the code. This code is
+# licensed on an "AS IS" basis and Intel is not obligated to provide
+# any support, assistance, installation, training, or other services
+# of any kind. Intel is also not obligated to provide any updates,
+# enhancements or extensions. Intel specifically disclaims any warranty
+# of merchantability, non-infringement, fitness for any particular
+# purpose, and any other warranty.
+#
+# Further, Intel disclaims all liability of any kind, including but
+# not limited to liability for infringement of any proprietary rights,
+# relating to the use of the code, even if Intel is notified of the
+# possibility of such liability. Except as expressly stated in an Intel
+# license agreement provided with this code and agreed upon with Intel,
+# no license, express or implied, by estoppel or otherwise, to any
+# intellectual property rights is granted herein.
+"""Asks a running miccheck --daemon whether the host and the devices are
+healthy. Only the standard socket module is imported, so this starts as
+fast as the interpreter does.
+
+usage: miccheck_status.py [--socket=PATH] [--telemetry[=SECONDS]]
+                          [DEVICE ...]
+
+Prints one line per target and exits with 0 if all of them are ok, 1 if
+any failed or has not been checked yet, and 2 if the daemon cannot be
+reached.
+
+With --telemetry, prints instead the temperature, fan, power and throttle
+state of each device over the last SECONDS (60 by default), if the daemon
+samples them, as min/mean/p95/max and throttled fraction of the samples.
+Exits with 0 if every device has samples, 1 otherwise."""
+import socket
+import sys
+
+SOCKET_PATH = '/var/run/miccheckd.sock'
+TIMEOUT = 5
+TELEMETRY_WINDOW = '60'
+
+
+def query(path, words):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(TIMEOUT)
+
+    try:
+        sock.connect(path)
+        sock.sendall(' '.join(words) + '\n')
+        answer = ''
+
+        while True:
+            data = sock.recv(4096)
+
+            if not data:
+                return answer
+            answer += data
+    finally:
+        sock.close()
+
+
+def main(argv):
+    path = SOCKET_PATH
+    request = 'status'
+    window = []
+    devices = []
+
+    for arg in argv:
+        if arg.startswith('--socket='):
+            path = arg[len('--socket='):]
+        elif arg == '--telemetry':
+            request = 'telemetry'
+            window = [TELEMETRY_WINDOW]
+        elif arg.startswith('--telemetry='):
+            request = 'telemetry'
+            window = [arg[len('--telemetry='):]]
+        elif arg.isdigit():
+            devices.append(arg)
+        else:
+            sys.stderr.write(__doc__.split('\n\n')[1] + '\n')
+            return 2
+
+    try:
+        answer = query(path, [request] + window + devices)
+    except socket.error, excp:
+        sys.stderr.write('Could not query miccheck daemon at %s: %s\n' %
+                         (path, excp))
+        return 2
+
+    sys.stdout.write(answer)
+    lines = answer.splitlines()
+
+    if request == 'telemetry':
+        return 0 if lines and all(line.split()[0] != 'error' and
+                                  line.split()[1:] != ['unknown']
+                                  for line in lines) else 1
+    return 0 if lines and all(line.split()[1:2] == ['ok'] for line in lines) \
+        else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))